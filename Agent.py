@@ -3,144 +3,441 @@ import psutil
 import time
 import platform
 import os
+import socket
+import mmap
+import random
+import struct
+import errno
+import fnmatch
+import getpass
 import sys
 import json
 from datetime import datetime
 import threading
 import logging
+import queue
+import uuid
 import numpy as np
-import joblib
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from wire_format import PACKED_FORMAT, encode_update
+from flat_forest import FlatForest
+from proc_scanner import (ProcScanner, available as proc_available, describe_process, new_rows,
+                          process_io_rates, network_deltas)
+from instrumentation import Metrics, RateLimitedLog, SamplingProfiler, serve_metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Instrumentation
+metrics = Metrics('threxel_agent')
+throttled_log = RateLimitedLog(logger)
+
 # Initialize Socket.IO client
-sio = socketio.Client(reconnection=True, reconnection_attempts=10, reconnection_delay=2, reconnection_delay_max=10)
+sio = socketio.Client(reconnection=False)  # Reconnects are handled by ReconnectLoop
 
 # Agent configuration
 AGENT_ID = "agent_001"
 SERVER_URL = "https://www.threxel.com"
+SOCKET_TRANSPORTS = ['websocket']  # No long-polling, so any server worker can take the connection
 SYSTEM_NAME = platform.node()
 VERSION = "1.0.0"
-CURRENT_USER = os.getlogin()
-MODEL_FILE = "anomaly_model.pkl"
+CURRENT_USER = getpass.getuser()  # os.getlogin() fails without a controlling terminal
+EMPLOYEE_ID = None  # This user's employee_id in the server's baselines; None skips baseline scoring
+MODEL_FILE = "anomaly_model.npz"  # Exported by "train model.py"
 NORMAL_HOURS = range(9, 17)  # 9:00 AM to 5:00 PM
 NORMAL_LOCATION = "Bahawalpur"
 DAILY_DATA_LIMIT_MB = 10240  # 10 GB
+SESSION_ID = uuid.uuid4().hex  # Lets the server tell agent restarts apart
+MAX_BATCH_LOGS = 500  # Max log entries shipped per update
+WIRE_FORMAT = PACKED_FORMAT  # Offered at registration; None always sends JSON
+EVENT_BUFFER_CAPACITY = 10000  # Newest logs also kept in memory; every unacked log is on disk
+SPILL_DIR = "agent_spill"  # Set to None to keep logs in memory only, dropping the oldest when full
+SPILL_SEGMENT_BYTES = 4 * 1024 * 1024  # Start a new spill segment after 4 MB
+SPILL_MAX_BYTES = 50 * 1024 * 1024  # 50 MB; the oldest segment is discarded beyond this
+UPDATE_INTERVAL = 1.0  # Seconds between regular updates
+RECONNECT_BASE_DELAY = 1.0  # First reconnect delay, doubled per failed attempt
+RECONNECT_MAX_DELAY = 60.0
+REPLAY_MAX_RATE = 2000  # Max backlog logs per second sent after a reconnect
+REPLAY_ACK_TIMEOUT = 10.0  # Seconds to wait for an answer before resending a backlog batch
+SCORE_BATCH_SIZE = 256  # Max feature vectors scored per forest pass
+SCORE_BATCH_WAIT = 0.05  # Seconds to wait for a batch to fill
+SCORING_MODE = "local"  # "server" asks the server to score feature vectors; scored here until it accepts
+METRICS_INTERVAL = 1.0  # Seconds between system metrics samples
+METRICS_PORT = 9464  # Local /metrics endpoint on 127.0.0.1; None disables it
+METRICS_SUMMARY_INTERVAL = 60  # Seconds between metrics summary log lines
+PROCESS_MONITOR_BACKEND = "auto"  # "netlink" (Linux proc connector, needs root), "poll" or "auto"
+PROCESS_POLL_INTERVAL = 1.0  # Seconds between PID set scans for the poll backend
+PROCESS_SCAN_IO = True  # Read per-process IO counters on each /proc scan; other users' processes need root
+PROCESS_IO_TOP = 5  # Busiest processes by IO sent with each update
+FILE_MONITOR_PATH = "/home"
+FILE_EVENT_WINDOW = 2.0  # Seconds a path must stay quiet before its events are reported
+FILE_EVENT_MAX_HOLD = 10.0  # Report paths that never go quiet at least this often
+FILE_EVENT_MAX_RATE = 50  # File logs emitted per second, excess is dropped
+FILE_EVENT_MAX_PENDING = 10000  # Distinct paths waiting to be reported
+FILE_INCLUDE_PATTERNS = ["*"]
+FILE_EXCLUDE_PATTERNS = ["*/.cache/*", "*/.git/*", "*.swp", "*.tmp", "*~"]
+
+# Linux proc connector constants (linux/netlink.h, linux/connector.h, linux/cn_proc.h)
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+PROC_EVENT_EXEC = 0x00000002
+PROC_EVENT_EXIT = 0x80000000
+NLMSG_DONE = 3
 
 # Load pre-trained model
-try:
-    model = joblib.load(MODEL_FILE)
-    logger.info("Loaded pre-trained anomaly detection model")
-except Exception as e:
-    logger.error(f"Error loading model: {e}")
-    model = None
+def load_model():
+    try:
+        loaded = FlatForest(MODEL_FILE)
+        logger.info("Loaded pre-trained anomaly detection model")
+        return loaded
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        return None
+
+model = load_model()  # Also used in server mode until the server accepts, and if it stops
+# Whether the server scores this agent's feature vectors; local until registration says otherwise
+scoring_state = {'server': False}
 
 # Track daily data usage
-daily_data_usage = 0
+daily_data_usage = 0  # MB sent and received since last_reset
 last_reset = datetime.now()
 
+# Reads processes and network counters from /proc; None off Linux, where psutil is used instead
+proc_scanner = ProcScanner(io=PROCESS_SCAN_IO) if proc_available() else None
+
+def read_network_counters():
+    """{interface: (bytes received, bytes sent)} through psutil, loopback excluded."""
+    return {name: (counters.bytes_recv, counters.bytes_sent)
+            for name, counters in psutil.net_io_counters(pernic=True).items() if not name.lower().startswith('lo')}
+
 # File system event handler
 class FileEventHandler(FileSystemEventHandler):
-    def __init__(self, log_callback):
-        self.log_callback = log_callback
+    def __init__(self, event_callback):
+        self.event_callback = event_callback
 
     def on_created(self, event):
         if not event.is_directory:
-            self.log_callback("File Created", f"File: {event.src_path}", 0.0, [])
+            self.event_callback("File Created", event.src_path)
 
     def on_modified(self, event):
         if not event.is_directory:
-            self.log_callback("File Modified", f"File: {event.src_path}", 0.0, [])
+            self.event_callback("File Modified", event.src_path)
 
     def on_deleted(self, event):
         if not event.is_directory:
-            self.log_callback("File Deleted", f"File: {event.src_path}", 0.0, [])
+            self.event_callback("File Deleted", event.src_path)
+
+# Events seen for one path since it was last reported
+class PendingFileEvent:
+    __slots__ = ('activity', 'created', 'first_seen', 'last_seen', 'count')
+
+    def __init__(self, activity, now):
+        self.activity = activity
+        self.created = activity == "File Created"
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 1
+
+# Filters file events, coalesces them per path until the path goes quiet,
+# and rate-limits what reaches the outbox
+class FileEventPipeline:
+    def __init__(self, window=FILE_EVENT_WINDOW, max_hold=FILE_EVENT_MAX_HOLD, max_rate=FILE_EVENT_MAX_RATE,
+                 max_pending=FILE_EVENT_MAX_PENDING, include=FILE_INCLUDE_PATTERNS, exclude=FILE_EXCLUDE_PATTERNS):
+        self.lock = threading.Lock()
+        self.window = window
+        self.max_hold = max_hold
+        self.max_rate = max_rate
+        self.max_pending = max_pending
+        self.include = include
+        self.exclude = exclude
+        self.pending = {}
+        self.tokens = max_rate
+        self.last_refill = time.monotonic()
+        self.outbox = None
+        self.counters = {
+            'received': 0,
+            'filtered': 0,  # Excluded by the glob rules
+            'coalesced': 0,  # Merged into an earlier event for the same path
+            'overflow_dropped': 0,  # Too many distinct paths pending
+            'rate_dropped': 0,  # Over FILE_EVENT_MAX_RATE
+            'emitted': 0
+        }
+
+    def start(self, outbox):
+        self.outbox = outbox
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def wanted(self, path):
+        return (any(fnmatch.fnmatch(path, pattern) for pattern in self.include)
+                and not any(fnmatch.fnmatch(path, pattern) for pattern in self.exclude))
+
+    def push(self, activity, path):
+        now = time.monotonic()
+        with self.lock:
+            self.counters['received'] += 1
+            if not self.wanted(path):
+                self.counters['filtered'] += 1
+                return
+            event = self.pending.get(path)
+            if event is not None:
+                event.activity = activity
+                event.created = event.created or activity == "File Created"
+                event.last_seen = now
+                event.count += 1
+                self.counters['coalesced'] += 1
+            elif len(self.pending) >= self.max_pending:
+                self.counters['overflow_dropped'] += 1
+            else:
+                self.pending[path] = PendingFileEvent(activity, now)
+
+    def run(self):
+        while True:
+            time.sleep(self.window / 2)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing file events: {e}")
+
+    def flush(self):
+        """Report every path that has gone quiet or been held too long."""
+        now = time.monotonic()
+        with self.lock:
+            ready = [(path, event) for path, event in self.pending.items()
+                     if now - event.last_seen >= self.window or now - event.first_seen >= self.max_hold]
+            for path, _ in ready:
+                del self.pending[path]
+            self.tokens = min(self.max_rate, self.tokens + (now - self.last_refill) * self.max_rate)
+            self.last_refill = now
+            allowed = min(len(ready), int(self.tokens))
+            self.tokens -= allowed
+            self.counters['rate_dropped'] += len(ready) - allowed
+            self.counters['emitted'] += allowed
+        for path, event in ready[:allowed]:
+            if event.activity == "File Deleted":
+                activity, size = event.activity, 0
+            else:
+                activity = "File Created" if event.created else event.activity
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+            self.outbox.append(log_activity(activity, f"File: {path} ({event.count} events, {size} bytes)", 0.0, []))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, pending=len(self.pending))
+
+file_pipeline = FileEventPipeline()
+
+def check_rules(timestamps, locations, over_limit=None):
+    """Rule-based checks for a batch: a score floor of 0.5 and alerts per flagged row."""
+    n = len(timestamps)
+    hours = np.fromiter((ts.hour for ts in timestamps), dtype=np.int64, count=n)
+    outside_hours = (hours < NORMAL_HOURS.start) | (hours >= NORMAL_HOURS.stop)
+    outside_location = np.fromiter((loc != NORMAL_LOCATION for loc in locations), dtype=bool, count=n)
+    if over_limit is None:
+        over_limit = np.full(n, daily_data_usage > DAILY_DATA_LIMIT_MB)
+    over_limit = np.asarray(over_limit, dtype=bool)
+
+    alerts = [[] for _ in range(n)]
+    for rule, message in ((outside_hours, "Usage outside 9 AM–5 PM"),
+                          (outside_location, f"Usage outside {NORMAL_LOCATION}"),
+                          (over_limit, "Data usage exceeds 10 GB")):
+        for i in np.flatnonzero(rule):
+            alerts[i].append(message)
+    return np.where(outside_hours | outside_location | over_limit, 0.5, 0.0), alerts
+
+@metrics.timed('detect_anomaly')
+def score_batch(features, timestamps, locations, over_limit=None):
+    """Score a batch of feature vectors with one pass over the forest.
+
+    Returns an array of anomaly scores in [0, 1] and a list of alerts per row.
+    """
+    n = len(features)
+    metrics.inc('scored_events', n)
+    if model is None:
+        return np.zeros(n), [[] for _ in range(n)]
+    anomaly_scores, suspicious = model.anomaly_scores(np.asarray(features, dtype=np.float64).reshape(n, -1))
+    floors, rule_alerts = check_rules(timestamps, locations, over_limit)
+    alerts = [(["Suspicious activity"] if suspicious[i] else []) + rule_alerts[i] for i in range(n)]
+    return np.maximum(anomaly_scores, floors), alerts
 
 def detect_anomaly(features, timestamp, location):
     """Detect anomalies using the pre-trained model and rule-based checks."""
     if model is None:
-        logger.warning("No model loaded, returning default values")
+        throttled_log.warning('no_model', "No model loaded, returning default values")
         return 0.0, []
     try:
-        features = np.array(features).reshape(1, -1)
-        prediction = model.predict(features)
-        score = -model.decision_function(features)[0]
-        anomaly_score = min(max((score + 1) / 2, 0), 1)
-        alerts = ["Suspicious activity"] if prediction[0] == -1 else []
-        
-        hour = timestamp.hour
-        if hour not in NORMAL_HOURS:
-            anomaly_score = max(anomaly_score, 0.5)
-            alerts.append("Usage outside 9 AM–5 PM")
-        if location != NORMAL_LOCATION:
-            anomaly_score = max(anomaly_score, 0.5)
-            alerts.append(f"Usage outside {NORMAL_LOCATION}")
-        global daily_data_usage
-        if daily_data_usage > DAILY_DATA_LIMIT_MB:
-            anomaly_score = max(anomaly_score, 0.5)
-            alerts.append("Data usage exceeds 10 GB")
-        
-        return anomaly_score, alerts
+        anomaly_scores, alerts = score_batch([features], [timestamp], [location])
+        return float(anomaly_scores[0]), alerts[0]
     except Exception as e:
         logger.error(f"Error detecting anomaly: {e}")
         return 0.0, []
 
-# Function to get system performance metrics
-def get_system_metrics():
-    global daily_data_usage, last_reset
-    try:
-        now = datetime.now()
-        if now.date() > last_reset.date():
-            daily_data_usage = 0
-            last_reset = now
-        
-        cpu_usage = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        network = psutil.net_io_counters()
-        
-        network_sent = getattr(network, 'bytes_sent', 0) / (1024 * 1024)  # MB
-        network_recv = getattr(network, 'bytes_recv', 0) / (1024 * 1024)  # MB
-        daily_data_usage += network_sent + network_recv
-        
-        metrics = {
-            'cpu': cpu_usage,
-            'memory_percent': memory.percent,
-            'disk_percent': disk.percent,
-            'network_sent': network_sent,
-            'network_received': network_recv
-        }
-        
-        location = NORMAL_LOCATION  # Replace with geolocation if available
-        timestamp = now
-        
-        features = [
-            metrics['cpu'],
-            metrics['memory_percent'],
-            metrics['disk_percent'],
-            metrics['network_sent'],
-            metrics['network_received'],
-            len(psutil.pids()),
-            0  # Default is_suspicious
-        ]
-        
-        anomaly_score, alerts = detect_anomaly(features, timestamp, location)
-        if anomaly_score > 0.3:
-            logs.append(log_activity(
+# Queues feature vectors and scores them in micro-batches on a worker thread
+class ScoringEngine:
+    def __init__(self, batch_size=SCORE_BATCH_SIZE, max_wait=SCORE_BATCH_WAIT):
+        self.queue = queue.Queue()
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.outbox = None
+
+    def start(self, outbox):
+        self.outbox = outbox
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, features, activity, details, timestamp=None, location=NORMAL_LOCATION, threshold=None):
+        """Queue a feature vector; its log is added once scored above threshold."""
+        timestamp = timestamp or datetime.now()
+        over_limit = daily_data_usage > DAILY_DATA_LIMIT_MB
+        self.queue.put((features, timestamp, location, over_limit, activity, details, threshold))
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.score(batch)
+
+    def score(self, batch):
+        try:
+            features, timestamps, locations, over_limit, activities, details, thresholds = zip(*batch)
+            if scoring_state['server']:
+                # Only the rules run here; the server adds the model's score and applies the threshold
+                anomaly_scores, alerts = check_rules(timestamps, locations, over_limit)
+                for i, score in enumerate(anomaly_scores.tolist()):
+                    log = log_activity(activities[i], details[i], score, alerts[i])
+                    log['features'] = [float(value) for value in features[i]]
+                    log['threshold'] = thresholds[i]
+                    self.outbox.append(log)
+                return
+            anomaly_scores, alerts = score_batch(features, timestamps, locations, over_limit)
+            for i, score in enumerate(anomaly_scores.tolist()):
+                if thresholds[i] is None or score > thresholds[i]:
+                    self.outbox.append(log_activity(activities[i], details[i], score, alerts[i]))
+        except Exception as e:
+            logger.error(f"Error scoring batch: {e}")
+
+scorer = ScoringEngine()
+
+# Samples system metrics on a fixed cadence into a shared snapshot, so
+# readers never wait on psutil.cpu_percent()
+class MetricsSampler:
+    def __init__(self, interval=METRICS_INTERVAL):
+        self.interval = interval
+        self.snapshot = None  # Replaced wholesale, so reads need no lock
+        self.processes = None  # /proc snapshot behind the previous sample
+        self.network = None  # Network counters at the previous sample
+        self.network_time = None
+
+    def start(self):
+        psutil.cpu_percent(interval=None)  # Prime the counter; the first reading is meaningless
+        self.sample()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        next_sample = time.monotonic()
+        while True:
+            next_sample += self.interval
+            time.sleep(max(next_sample - time.monotonic(), 0))
+            self.sample()
+
+    @metrics.timed('sample_metrics')
+    def sample(self):
+        global daily_data_usage, last_reset
+        try:
+            now = datetime.now()
+            if now.date() > last_reset.date():
+                daily_data_usage = 0
+                last_reset = now
+
+            cpu_usage = psutil.cpu_percent(interval=None)  # Usage since the previous sample
+            memory = psutil.virtual_memory()
+            disk = psutil.disk_usage('/')
+            # Reuses the process monitor's scan when it ran this interval
+            processes = proc_scanner.recent(self.interval, after=self.processes) if proc_scanner else None
+            network = processes.network if processes else read_network_counters()
+            network_time = processes.time if processes else time.monotonic()
+
+            # The counters are totals since boot; only the change since the last sample is new traffic
+            network_sent = network_recv = 0.0
+            if self.network is not None and network_time > self.network_time:
+                received, sent = network_deltas(self.network, network)
+                daily_data_usage += (received + sent) / (1024 * 1024)
+                hours = (network_time - self.network_time) / 3600
+                network_sent = sent / (1024 * 1024) / hours  # MB per hour, the unit the model was trained on
+                network_recv = received / (1024 * 1024) / hours
+            self.network, self.network_time = network, network_time
+            process_io = self.busiest_processes(self.processes, processes) if processes and self.processes else []
+            self.processes = processes
+
+            performance = {
+                'cpu': cpu_usage,
+                'memory_percent': memory.percent,
+                'disk_percent': disk.percent,
+                'network_sent': network_sent,
+                'network_received': network_recv
+            }
+            pid_count = len(processes) if processes else len(psutil.pids())
+            self.snapshot = {
+                'timestamp': now,
+                'metrics': performance,
+                'pid_count': pid_count,
+                'process_io': process_io,
+                # Feature vector prefix shared by every event in this interval
+                'base_features': [cpu_usage, memory.percent, disk.percent, network_sent, network_recv]
+            }
+
+            location = NORMAL_LOCATION  # Replace with geolocation if available
+            scorer.submit(
+                self.snapshot['base_features'] + [pid_count, 0],  # Default is_suspicious
                 "System Metrics Anomaly",
                 f"Metrics: CPU={cpu_usage}%, Memory={memory.percent}%, Disk={disk.percent}%, Location={location}",
-                anomaly_score,
-                alerts
-            ))
-        
-        return metrics
-    except Exception as e:
-        logger.error(f"Error getting system metrics: {e}")
+                now,
+                location,
+                threshold=0.3
+            )
+        except Exception as e:
+            logger.error(f"Error sampling system metrics: {e}")
+
+    @staticmethod
+    def busiest_processes(previous, current, limit=PROCESS_IO_TOP):
+        """The processes that read and wrote the most between two /proc scans."""
+        rows, reads, writes = process_io_rates(previous, current)
+        top = np.argsort(-(reads + writes))[:limit]
+        return [{'pid': int(current.pid[rows[i]]), 'name': current.describe(rows[i])[0],
+                 'read_bytes_per_second': float(reads[i]), 'write_bytes_per_second': float(writes[i])}
+                for i in top if reads[i] + writes[i] > 0]
+
+    def latest(self):
+        return self.snapshot
+
+sampler = MetricsSampler()
+
+# Function to get system performance metrics
+@metrics.timed('get_system_metrics')
+def get_system_metrics():
+    """Return the latest sampled metrics without blocking."""
+    snapshot = sampler.latest()
+    if snapshot is None:
         return {'cpu': 0, 'memory_percent': 0, 'disk_percent': 0, 'network_sent': 0, 'network_received': 0}
+    return snapshot['metrics']
+
+def get_process_io():
+    """The busiest processes by IO over the latest sample interval."""
+    snapshot = sampler.latest()
+    return snapshot['process_io'] if snapshot else []
 
 # Function to log activities
 def log_activity(activity, details="", anomaly_score=0.0, alerts=None):
@@ -153,53 +450,451 @@ def log_activity(activity, details="", anomaly_score=0.0, alerts=None):
         'alerts': alerts if alerts else []
     }
 
-# Monitor system events and user activities
-def monitor_system_events():
-    logs = []
-    logs.append(log_activity("System Startup", f"System started by {CURRENT_USER}"))
+# Compact record for a buffered log entry
+class LogRecord:
+    __slots__ = ('seq', 'timestamp', 'activity', 'details', 'anomaly_score', 'alerts', 'features', 'threshold')
 
-    def process_monitor():
+    def __init__(self, seq, log):
+        self.seq = seq
+        self.timestamp = log['timestamp']
+        self.activity = log['activity']
+        self.details = log['details']
+        self.anomaly_score = float(log['anomaly_score'])
+        self.alerts = tuple(log['alerts'])
+        self.features = log.get('features')  # Left for the server to score
+        self.threshold = log.get('threshold')
+
+    def to_dict(self):
+        log = {
+            'seq': self.seq,
+            'timestamp': self.timestamp,
+            'activity': self.activity,
+            'details': self.details,
+            'anomaly_score': self.anomaly_score,
+            'alerts': list(self.alerts)
+        }
+        if self.features is not None:
+            log['features'] = self.features
+            log['threshold'] = self.threshold
+        return log
+
+# Append-only segment log of every log not yet acknowledged, written as each
+# log is created so none are lost if the agent is killed or the machine
+# reboots while offline. Lines are "seq<TAB>json", segments are read through
+# mmap and named after their first seq, fully acknowledged segments are
+# deleted, and the oldest segment is discarded once the total passes
+# max_bytes. Callers hold the outbox lock.
+class SpillStore:
+    def __init__(self, directory=SPILL_DIR, segment_bytes=SPILL_SEGMENT_BYTES, max_bytes=SPILL_MAX_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.segments = []  # [path, size, acked offset], oldest first
+        self.cursor = None  # (seq, path, offset) just past the last line read, so reads resume there
+        self.writer = None
+        self.maps = {}
+        self.size = 0  # Bytes on disk
+        self.spilled = 0
+        self.dropped = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def take_leftovers(self):
+        """Read and delete the unacknowledged logs left by a previous run, oldest first."""
+        acked_path = os.path.join(self.directory, "acked")
+        try:
+            with open(acked_path) as f:
+                acked = int(f.read())
+        except (OSError, ValueError):
+            acked = 0
+        logs = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".seg"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        seq, _, log = line.partition(b"\t")
+                        if line.endswith(b"\n") and int(seq) > acked:  # Skip a line torn by a crash
+                            logs.append(json.loads(log))
+                os.remove(path)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error recovering spill segment {path}: {e}")
+        if os.path.exists(acked_path):
+            os.remove(acked_path)  # Seqs start again from 1 in this run
+        return logs
+
+    def append(self, record):
+        line = f"{record.seq}\t{json.dumps(record.to_dict())}\n".encode()
+        try:
+            if self.writer is None or self.segments[-1][1] >= self.segment_bytes:
+                self._open_segment(record.seq)
+            if self.writer.write(line) != len(line):
+                raise OSError(f"short write to {self.segments[-1][0]}")
+        except OSError as e:
+            # Not on disk, so lost if it leaves the memory ring before it's acked
+            logger.error(f"Error spilling log to disk: {e}")
+            self.dropped += 1
+            self._close_writer()
+            return
+        self.segments[-1][1] += len(line)
+        self.size += len(line)
+        self.spilled += 1
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            path, size, offset = self.segments[0]
+            self.dropped += self._map(self.segments[0])[offset:size].count(b"\n")
+            self._delete_oldest()
+
+    def _open_segment(self, first_seq):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        path = os.path.join(self.directory, f"{first_seq:012d}.seg")
+        self.writer = open(path, 'ab', buffering=0)  # Unbuffered: a failed write leaves nothing to flush later
+        self.segments.append([path, 0, 0])
+
+    def _close_writer(self):
+        """After a failed write: cut the segment back to its recorded size and
+        leave it, so the next log starts a new one and offsets stay exact."""
+        if self.writer is None:
+            return
+        path, size = self.segments[-1][0], self.segments[-1][1]
+        try:
+            self.writer.close()
+            os.truncate(path, size)
+        except OSError as e:
+            logger.error(f"Error truncating spill segment {path}: {e}")  # Reads stop at size anyway
+        self.writer = None
+
+    def _map(self, segment):
+        path, size = segment[0], segment[1]
+        if size == 0:
+            return b""  # mmap can't map an empty file, e.g. after a failed first write
+        view = self.maps.get(path)
+        if view is None or len(view) < size:  # The active segment has grown
+            if view is not None:
+                view.close()
+            with open(path, 'rb') as f:
+                view = self.maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return view
+
+    def _delete_oldest(self):
+        path, size, _ = self.segments.pop(0)
+        view = self.maps.pop(path, None)
+        if view is not None:
+            view.close()
+        if self.cursor and self.cursor[1] == path:
+            self.cursor = None
+        if not self.segments and self.writer:
+            self.writer.close()
+            self.writer = None
+        self.size -= size
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error deleting spill segment {path}: {e}")
+
+    def _lines(self, segment, offset=None):
+        """Yield (seq, start, end) for lines of a segment from offset, by default its unacked ones."""
+        view = self._map(segment)
+        offset, size = segment[2] if offset is None else offset, segment[1]
+        while offset < size:
+            end = view.find(b"\n", offset, size) + 1
+            if end == 0:
+                return  # No complete line left
+            tab = view.find(b"\t", offset, end)
+            yield int(view[offset:tab]), offset, end
+            offset = end
+
+    def read(self, limit, after=0, before=None):
+        """Return logs with seq above after (and below before), oldest first, up to limit."""
+        batch = []
+        start, offset = 0, None
+        if self.cursor and self.cursor[0] <= after:
+            # Resume past the last line read instead of rescanning everything unacked
+            for i, segment in enumerate(self.segments):
+                if segment[0] == self.cursor[1]:
+                    start, offset = i, max(self.cursor[2], segment[2])
+                    break
+        for segment in self.segments[start:]:
+            view = self._map(segment)
+            for seq, line_start, end in self._lines(segment, offset):
+                if len(batch) >= limit or (before is not None and seq >= before):
+                    return batch
+                if seq > after:
+                    batch.append(json.loads(view[view.find(b"\t", line_start, end) + 1:end]))
+                self.cursor = (seq, segment[0], end)
+            offset = None
+        return batch
+
+    def ack(self, seq):
+        while self.segments:
+            segment = self.segments[0]
+            for line_seq, start, end in self._lines(segment):
+                if line_seq > seq:
+                    break
+                segment[2] = end
+            else:
+                self._delete_oldest()
+                continue
+            break
+        if self.segments:
+            self._save_acked(seq)
+
+    def _save_acked(self, seq):
+        """Record seq on disk, so a restart doesn't resend the acked part of a segment."""
+        path = os.path.join(self.directory, "acked")
+        try:
+            with open(path + ".tmp", 'w') as f:
+                f.write(str(seq))
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.error(f"Error saving spill acknowledgement: {e}")
+
+    def unread_bytes(self):
+        return sum(size - offset for _, size, offset in self.segments)
+
+# Sequence-numbered outbox of logs waiting for a server acknowledgement.
+# Every log is appended to disk segments as it's created and stays there
+# until acknowledged; a fixed-capacity ring keeps the newest in memory, so
+# sending only reads the disk for a backlog larger than the ring. Logs left
+# on disk by a previous run are queued again.
+class LogOutbox:
+    def __init__(self, capacity=EVENT_BUFFER_CAPACITY, spill_dir=SPILL_DIR):
+        self.lock = threading.Lock()
+        self.replied = threading.Event()  # Set whenever the server answers an update
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0
+        self.count = 0
+        self.next_seq = 1
+        self.acked_seq = 0  # Written to MongoDB
+        self.queued_seq = 0  # Accepted by the server; everything after it is unsent
+        self.spill = SpillStore(spill_dir) if spill_dir else None  # None disables spilling
+        self.dropped = 0
+        if self.spill:
+            for log in self.spill.take_leftovers():
+                self.append(log)
+
+    def append(self, log):
+        with self.lock:
+            record = LogRecord(self.next_seq, log)
+            if self.spill:
+                self.spill.append(record)
+            if self.count == self.capacity:
+                self._evict_oldest()
+            self.slots[(self.head + self.count) % self.capacity] = record
+            self.count += 1
+            self.next_seq += 1
+
+    def _evict_oldest(self):
+        self.slots[self.head] = None
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        if self.spill is None:
+            self.dropped += 1  # Still on disk otherwise
+
+    def pending(self, limit=MAX_BATCH_LOGS, after=0):
+        """Return the oldest unacknowledged logs with seq above after, up to limit."""
+        with self.lock:
+            oldest = self.slots[self.head].seq if self.count else self.next_seq
+            # Only logs older than the ring need reading back from disk
+            batch = self.spill.read(limit, after, before=oldest) if self.spill and after + 1 < oldest else []
+            skip = min(max(after + 1 - self.slots[self.head].seq, 0), self.count) if self.count else 0
+            for i in range(skip, min(self.count, skip + limit - len(batch))):
+                batch.append(self.slots[(self.head + i) % self.capacity].to_dict())
+            return batch
+
+    def unsent(self, limit=MAX_BATCH_LOGS):
+        """Return logs the server has not accepted yet, up to limit."""
+        return self.pending(limit, max(self.queued_seq, self.acked_seq))
+
+    def resend(self):
+        """Send everything unacknowledged again, e.g. after reconnecting."""
+        self.queued_seq = self.acked_seq
+
+    def ack(self, seq):
+        """Drop every log up to and including seq."""
+        with self.lock:
+            if seq <= self.acked_seq:
+                return
+            self.acked_seq = seq
+            if self.spill:
+                self.spill.ack(seq)
+            while self.count and self.slots[self.head].seq <= seq:
+                self.slots[self.head] = None
+                self.head = (self.head + 1) % self.capacity
+                self.count -= 1
+
+    def on_ack(self, response):
+        if response and 'acked_seq' in response:
+            self.ack(response['acked_seq'])
+            # Older servers only report acked_seq
+            self.queued_seq = response.get('queued_seq', response['acked_seq'])
+        self.replied.set()
+
+    def stats(self):
+        with self.lock:
+            spill = self.spill
+            return {
+                'buffered': self.count,
+                'spill_bytes': spill.unread_bytes() if spill else 0,
+                'spill_segments': len(spill.segments) if spill else 0,
+                'spilled': spill.spilled if spill else 0,
+                'dropped': self.dropped + (spill.dropped if spill else 0)
+            }
+
+    def __len__(self):
+        with self.lock:
+            return self.count
+
+# Finds new processes by diffing the full PID set; works on every platform.
+# With a /proc scanner it diffs scans instead, which catches reused PIDs and
+# already holds each new process's name and exe for on_start.
+class PollingProcessWatcher:
+    name = "poll"
+
+    def __init__(self, on_start, on_exit=None, interval=PROCESS_POLL_INTERVAL, scanner=None):
+        self.on_start = on_start
+        self.on_exit = on_exit
+        self.interval = interval
+        self.scanner = scanner
+
+    def run(self):
+        if self.scanner:
+            return self.run_scans()
         known_pids = set()
         while True:
             try:
                 current_pids = set(psutil.pids())
-                new_pids = current_pids - known_pids
-                for pid in new_pids:
-                    try:
-                        p = psutil.Process(pid)
-                        is_suspicious = 1 if any(name in p.name().lower() for name in ["bash", "sh"]) else 0
-                        metrics = get_system_metrics()
-                        features = [
-                            metrics['cpu'],
-                            metrics['memory_percent'],
-                            metrics['disk_percent'],
-                            metrics['network_sent'],
-                            metrics['network_received'],
-                            len(current_pids),
-                            is_suspicious
-                        ]
-                        anomaly_score, alerts = detect_anomaly(
-                            features, 
-                            datetime.now(), 
-                            NORMAL_LOCATION
-                        )
-                        logs.append(log_activity(
-                            "Process Started",
-                            f"Process: {p.name()} (PID: {pid}, Path: {p.exe()}), Location={NORMAL_LOCATION}",
-                            anomaly_score,
-                            alerts
-                        ))
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
+                for pid in current_pids - known_pids:
+                    self.on_start(pid)
+                if self.on_exit:
+                    for pid in known_pids - current_pids:
+                        self.on_exit(pid)
                 known_pids = current_pids
-                time.sleep(1)
             except Exception as e:
                 logger.error(f"Error in process monitor: {e}")
+            time.sleep(self.interval)
+
+    def run_scans(self):
+        previous = None
+        while True:
+            try:
+                current = self.scanner.scan()
+                for row in new_rows(previous, current):
+                    self.on_start(int(current.pid[row]), current.describe(row))
+                if self.on_exit and previous is not None:
+                    for row in new_rows(current, previous):
+                        self.on_exit(int(previous.pid[row]))
+                previous = current
+            except Exception as e:
+                logger.error(f"Error in process monitor: {e}")
+            time.sleep(self.interval)
+
+# Receives exec/exit events from the kernel proc connector as they happen
+class ProcConnectorWatcher:
+    name = "netlink"
+
+    def __init__(self, on_start, on_exit=None):
+        self.on_start = on_start
+        self.on_exit = on_exit
+        self.overruns = 0  # Times the kernel dropped events because we fell behind
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+            self.sock.bind((0, CN_IDX_PROC))
+            # cn_msg header (idx, val, seq, ack, len, flags) followed by the op
+            message = struct.pack('=IIIIHHI', CN_IDX_PROC, CN_VAL_PROC, 0, 0, 4, 0, PROC_CN_MCAST_LISTEN)
+            self.sock.send(struct.pack('=IHHII', 16 + len(message), NLMSG_DONE, 0, 0, 0) + message)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def run(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    self.overruns += 1
+                    logger.warning("Proc connector buffer overrun, some process events were lost")
+                    continue
+                logger.error(f"Error in process monitor: {e}")
+                time.sleep(1)
+                continue
+            offset = 0
+            while offset + 60 <= len(data):
+                # nlmsghdr (16 bytes) + cn_msg (20 bytes) + proc_event header (16 bytes)
+                length = struct.unpack_from('=I', data, offset)[0]
+                what = struct.unpack_from('=I', data, offset + 36)[0]
+                pid, tgid = struct.unpack_from('=ii', data, offset + 52)
+                if pid == tgid:  # Skip thread events
+                    try:
+                        if what == PROC_EVENT_EXEC:
+                            self.on_start(pid)
+                        elif what == PROC_EVENT_EXIT and self.on_exit:
+                            self.on_exit(pid)
+                    except Exception as e:
+                        logger.error(f"Error in process monitor: {e}")
+                if length < 16:
+                    break
+                offset += (length + 3) & ~3  # NLMSG_ALIGN
+
+def create_process_watcher(on_start, on_exit=None, backend=PROCESS_MONITOR_BACKEND):
+    """Return the netlink watcher where available, else the polling one."""
+    if backend in ("auto", "netlink") and sys.platform.startswith("linux"):
+        try:
+            return ProcConnectorWatcher(on_start, on_exit)
+        except OSError as e:
+            if backend == "netlink":
+                raise
+            logger.warning(f"Proc connector unavailable ({e}), falling back to polling")
+    return PollingProcessWatcher(on_start, on_exit, scanner=proc_scanner)
+
+# Monitor system events and user activities
+def monitor_system_events():
+    logs = LogOutbox()
+    logs.append(log_activity("System Startup", f"System started by {CURRENT_USER}"))
+    scorer.start(logs)
+    sampler.start()
+    file_pipeline.start(logs)
+
+    def on_process_start(pid, info=None):
+        if info is None and proc_scanner:
+            info = describe_process(pid) or ("(exited)", "")  # Short-lived process reported by the proc connector
+        if info is None:
+            try:
+                p = psutil.Process(pid)
+                info = p.name(), p.exe()
+            except psutil.NoSuchProcess:
+                info = "(exited)", ""
+            except psutil.AccessDenied:
+                return
+        name, exe = info
+        if exe is None:
+            return  # Another user's process, without the rights to see it
+        is_suspicious = 1 if any(shell in name.lower() for shell in ["bash", "sh"]) else 0
+        snapshot = sampler.latest()
+        if snapshot:
+            features = snapshot['base_features'] + [snapshot['pid_count'], is_suspicious]
+        else:
+            features = [0, 0, 0, 0, 0, 0, is_suspicious]
+        scorer.submit(
+            features,
+            "Process Started",
+            f"Process: {name} (PID: {pid}, Path: {exe}), Location={NORMAL_LOCATION}"
+        )
+
+    def process_monitor():
+        watcher = create_process_watcher(on_process_start)
+        logger.info(f"Process monitor using {watcher.name} backend")
+        watcher.run()
 
     def file_monitor():
-        event_handler = FileEventHandler(log_activity)
+        event_handler = FileEventHandler(file_pipeline.push)
         observer = Observer()
-        observer.schedule(event_handler, path='/home', recursive=True)  # Monitor /home directory
+        observer.schedule(event_handler, path=FILE_MONITOR_PATH, recursive=True)
         observer.start()
         try:
             while True:
@@ -212,46 +907,137 @@ def monitor_system_events():
     threading.Thread(target=file_monitor, daemon=True).start()
     return logs
 
-# Main loop to send updates
+# Keeps the connection up from a background thread, so the main loop never
+# blocks on an unreachable server. Failed attempts back off exponentially
+# with full jitter, so a fleet of agents doesn't reconnect in lockstep.
+class ReconnectLoop:
+    def __init__(self, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.wakeup = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        attempt = 0
+        while True:
+            if sio.connected:
+                attempt = 0
+                self.wakeup.wait(5)  # Set by the disconnect handler
+                self.wakeup.clear()
+                continue
+            try:
+                logger.info(f"Attempting to connect Agent {AGENT_ID} to {SERVER_URL}")
+                sio.connect(SERVER_URL, wait_timeout=10, transports=SOCKET_TRANSPORTS)
+            except Exception as e:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                logger.warning(f"Connect attempt {attempt} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+reconnector = ReconnectLoop()
+
+# Main loop to send updates; returns the number of logs sent
+@metrics.timed('send_update')
 def send_update(logs):
+    if not sio.connected:
+        return 0  # Logs stay in the outbox until the reconnect loop succeeds
     try:
-        if not sio.connected:
-            sio.connect(SERVER_URL, wait_timeout=10)
-        metrics = get_system_metrics()
+        performance = get_system_metrics()
+        batch = logs.unsent()
         update_data = {
             'agent_id': AGENT_ID,
+            'session_id': SESSION_ID,
             'system_name': SYSTEM_NAME,
             'version': VERSION,
             'current_user': CURRENT_USER,
+            'employee_id': EMPLOYEE_ID,
             'status': 'active',
-            'performance': metrics,
-            'cpu_trend': [metrics['cpu']] * 5,
-            'network_traffic': {'daily_usage': metrics['network_sent'] + metrics['network_received']},
+            'performance': performance,
+            'cpu_trend': [performance['cpu']] * 5,
+            'network_traffic': {'daily_usage': daily_data_usage},  # MB today
             'analysis': {
-                'suspicious_patterns': [log['activity'] for log in logs if log['anomaly_score'] > 0.3],
-                'risk_score': sum(log['anomaly_score'] for log in logs) * 10
+                'suspicious_patterns': [log['activity'] for log in batch if log['anomaly_score'] > 0.3],
+                'risk_score': sum(log['anomaly_score'] for log in batch) * 10
             },
-            'logs': logs
+            'logs': batch,  # Only logs the server has not accepted yet
+            'buffer': logs.stats(),
+            'file_events': file_pipeline.stats(),
+            'process_io': get_process_io()
         }
-        sio.emit('log_update', update_data)
-        logger.info(f"Sent update for Agent {AGENT_ID}")
+        if wire_state['format'] == PACKED_FORMAT:
+            sio.emit('log_update', encode_update(update_data), callback=logs.on_ack)
+        else:
+            sio.emit('log_update', update_data, callback=logs.on_ack)
+        metrics.inc('updates_sent')
+        metrics.inc('logs_sent', len(batch))
+        throttled_log.info('sent', f"Sent update for Agent {AGENT_ID} ({len(batch)} logs)")
+        return len(batch)
     except Exception as e:
-        logger.error(f"Error sending update: {e}")
+        metrics.inc('send_errors')
+        throttled_log.warning('send_error', f"Error sending update: {e}")
+        return 0
+
+def run_updates(logs):
+    """Send an update every UPDATE_INTERVAL, draining any backlog in between."""
+    sid = None
+    while True:
+        if sio.sid != sid:
+            sid = sio.sid
+            logs.resend()  # Logs accepted on the old connection may never have been written
+        logs.replied.clear()
+        started = time.monotonic()
+        sent = send_update(logs)
+        if sent >= MAX_BATCH_LOGS:
+            # More logs are waiting: send the next batch once the server has
+            # answered this one, at no more than REPLAY_MAX_RATE logs per second
+            if not logs.replied.wait(REPLAY_ACK_TIMEOUT):
+                logs.resend()
+            time.sleep(max(sent / REPLAY_MAX_RATE - (time.monotonic() - started), 0))
+            continue
+        time.sleep(max(UPDATE_INTERVAL - (time.monotonic() - started), 0))
+        logs.append(log_activity(
+            "User Activity",
+            f"User {CURRENT_USER} performed an action",
+            anomaly_score=0.0
+        ))
+
+# Wire format accepted by the server for this connection; JSON until it answers
+wire_state = {'format': None}
+
+def on_registered(response):
+    if response and response.get('wire_format') == WIRE_FORMAT:
+        wire_state['format'] = WIRE_FORMAT
+        logger.info(f"Server accepted {WIRE_FORMAT} updates")
+    if SCORING_MODE == 'server':
+        scoring_state['server'] = bool(response) and response.get('scoring') == 'server'
+        if scoring_state['server']:
+            logger.info("Server scores this agent's events")
+        else:
+            logger.warning("Server does not offer scoring; scoring locally")
 
 @sio.event
 def connect():
     logger.info(f"Agent {AGENT_ID} connected to server")
+    wire_state['format'] = None
+    scoring_state['server'] = False  # This server may not have a model
     sio.emit('register_agent', {
         'agent_id': AGENT_ID,
+        'session_id': SESSION_ID,
         'system_name': SYSTEM_NAME,
         'version': VERSION,
         'current_user': CURRENT_USER,
-        'status': 'active'
-    })
+        'employee_id': EMPLOYEE_ID,
+        'status': 'active',
+        'wire_formats': [WIRE_FORMAT] if WIRE_FORMAT else [],
+        'scoring': SCORING_MODE
+    }, callback=on_registered)
 
 @sio.event
 def disconnect():
     logger.warning(f"Agent {AGENT_ID} disconnected from server")
+    reconnector.wakeup.set()
 
 @sio.event
 def connect_error(data):
@@ -259,17 +1045,16 @@ def connect_error(data):
 
 if __name__ == "__main__":
     try:
-        logger.info(f"Attempting to connect Agent {AGENT_ID} to {SERVER_URL}")
-        sio.connect(SERVER_URL, wait_timeout=10)
+        profiler = None
+        if SamplingProfiler.enabled():
+            profiler = SamplingProfiler()
+            profiler.start()
+        if METRICS_PORT:
+            serve_metrics(metrics, METRICS_PORT, profiler)
+        metrics.start_summary(logger, METRICS_SUMMARY_INTERVAL)
+        reconnector.start()
         logs = monitor_system_events()
-        while True:
-            send_update(logs)
-            time.sleep(1)
-            logs.append(log_activity(
-                "User Activity",
-                f"User {CURRENT_USER} performed an action",
-                anomaly_score=0.0
-            ))
+        run_updates(logs)
     except KeyboardInterrupt:
         logs.append(log_activity("Agent Stopped", "Agent manually stopped"))
         send_update(logs)
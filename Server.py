@@ -1,71 +1,836 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-from flask_socketio import SocketIO, emit
+import atexit
+import base64
+import os
+
+# Serving mode: "gevent" runs each connection as a greenlet so thousands of
+# long-lived agent sockets fit in one worker. Defaults to threading: left to
+# auto-detect, Flask-SocketIO would pick gevent without monkey-patching.
+# Patching must happen before anything else imports socket or threading.
+ASYNC_MODE = os.environ.get('THREXEL_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask_socketio import SocketIO, emit, join_room
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, ExecutionTimeout
+from bson import ObjectId
+from bson.errors import InvalidId
 import json
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
+import threading
+import time
+import math
+import re
+import heapq
+from collections import deque
+import numpy as np
+from shared_state import create_agent_store, create_client_manager
+from baselines import BaselineRegistry
+from flat_forest import FlatForest, install_model
+from instrumentation import Metrics, RateLimitedLog, SamplingProfiler
+from traffic_recorder import TrafficRecorder
+from wire_format import PACKED_FORMAT, decode_update
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Instrumentation; counters and latencies are per worker process
+METRICS_SUMMARY_INTERVAL = 60  # Seconds between metrics summary log lines
+metrics = Metrics('threxel_server')
+throttled_log = RateLimitedLog(logger)
+profiler = SamplingProfiler() if SamplingProfiler.enabled() else None
+if profiler and not SamplingProfiler.supported():
+    logger.warning("THREXEL_PROFILE ignored: the sampling profiler cannot see greenlets under gevent")
+    profiler = None
+
+# Agent traffic recording for "replay traffic.py"; see traffic_recorder.py
+TRAFFIC_RECORD_PATH = os.environ.get('THREXEL_RECORD')  # None disables recording
+traffic_recorder = TrafficRecorder(TRAFFIC_RECORD_PATH) if TRAFFIC_RECORD_PATH else None
+if traffic_recorder:
+    atexit.register(traffic_recorder.close)
+    logger.info(f"Recording agent traffic to {traffic_recorder.path}")
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'  # Change to a strong secret key in production
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+# Shared state for running several worker processes; see shared_state.py
+SHARED_STATE_URL = os.environ.get('THREXEL_SHARED_STATE')  # None keeps state in this process
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    client_manager=create_client_manager(SHARED_STATE_URL))
+
+# Write-behind configuration
+WRITE_FLUSH_INTERVAL = 1.0  # Seconds between bulk writes
+WRITE_FLUSH_SIZE = 1000  # Flush early once this many logs are queued
+WRITE_QUEUE_MAX_LOGS = 50000  # Reject updates beyond this; agents keep and resend them
+RECENT_LOGS_LIMIT = 25  # Logs per agent shown on the dashboard
+
+# Dashboard fan-out configuration
+DASHBOARD_ROOM = 'dashboards'  # Socket.IO room logged-in dashboards join
+DASHBOARD_FRAME_INTERVAL = 0.5  # Seconds between coalesced dashboard updates
+ALERT_COOLDOWN = 60  # Seconds before the same alert is repeated for an agent
+DASHBOARD_FIELDS = ('system_name', 'version', 'current_user', 'status', 'data_usage',
+                    'behavior_anomalies', 'total_logs', 'peer_deviation', 'risk', 'baseline', 'performance', 'cpu_trend',
+                    'process_io')
+
+# Anomaly aggregation configuration
+RISK_WINDOWS = {'1m': 60, '15m': 900, '1h': 3600}  # Sliding windows kept per agent
+RISK_WINDOW_BUCKETS = 60  # Buckets per window; expiry granularity is window / buckets
+PEER_WINDOW = '15m'  # Window whose score sum is compared across the fleet
+RISK_EWMA_HALF_LIFE = 300  # Seconds for an old score to lose half its weight
+
+# Per-entity baseline configuration; build the registry with `python baselines.py <data>`
+BASELINE_DIR = "baselines"
+BASELINE_CACHE_SIZE = 10000  # Baselines kept in memory
+BASELINE_ENTITY_FIELD = 'employee_id'  # Agent field matching the baselines' employee_id; 'system_name' for per-host
+BASELINE_METRICS = ('cpu', 'memory_percent', 'disk_percent', 'network_sent', 'network_received')  # Network in MB per hour
+
+# Server-side scoring for agents with SCORING_MODE = "server"; see ScoringService
+SCORING_MODEL_FILE = "anomaly_model.npz"  # Exported by "train model.py"; reloaded when it changes
+SCORING_MODEL_DIR = "models"  # Versioned exports /api/model can install as the model file
+SCORING_WORKERS = 2
+SCORING_BATCH_ROWS = 4096  # Max feature vectors per forest pass
+SCORING_BATCH_WAIT = 0.05  # Seconds workers wait for a batch to fill
+SCORING_QUEUE_MAX_ROWS = 100000  # Reject updates beyond this; agents keep and resend them
+MODEL_POLL_INTERVAL = 10  # Seconds between checks of the model file
+
+# Log storage configuration
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Format agents send timestamps in, local time
+LOG_RETENTION_DAYS = None  # Expire logs after this many days; None keeps them forever
+LOGS_TIME_SERIES = False  # Create the logs collection as a time-series collection (MongoDB 5.0+)
+
+# Log history API configuration
+LOG_PAGE_SIZE = 100  # Logs per page unless the request asks for fewer or more
+LOG_PAGE_MAX = 1000
+LOG_QUERY_MAX_TIME_MS = 5000  # History queries and aggregations running longer are aborted
+AGGREGATE_MAX_GROUPS = 10000  # Groups returned by one aggregation
+AGENT_PAGE_SIZE = 60  # Agents per dashboard page
 
 # MongoDB Setup
 try:
     client = MongoClient('mongodb://localhost:27017/')
     db = client['agent_logs']
+    retention_seconds = LOG_RETENTION_DAYS * 86400 if LOG_RETENTION_DAYS else None
+    if LOGS_TIME_SERIES and 'logs' not in db.list_collection_names():
+        options = {'timeseries': {'timeField': 'timestamp', 'metaField': 'agent_id', 'granularity': 'seconds'}}
+        if retention_seconds:
+            options['expireAfterSeconds'] = retention_seconds
+        db.create_collection('logs', **options)
     logs_collection = db['logs']
-    # Create index for efficient queries
-    logs_collection.create_index([("agent_id", 1), ("timestamp", -1)])
+    # Create indexes for per-agent history and fleet-wide time range queries.
+    # History pages run newest first by (timestamp, _id), so every index ends
+    # in both; anomaly_score after them lets min_score filter on index keys alone.
+    logs_collection.create_index([("agent_id", 1), ("timestamp", -1), ("_id", -1), ("anomaly_score", 1)])
+    logs_collection.create_index([("timestamp", -1), ("_id", -1), ("anomaly_score", 1)])
+    logs_collection.create_index([("activity", 1), ("timestamp", -1), ("_id", -1)])
+    logs_collection.create_index([("alerts", 1), ("timestamp", -1), ("_id", -1)])  # One entry per alert
+    if not LOGS_TIME_SERIES:
+        # Time-series collections can't have text indexes
+        logs_collection.create_index([("details", "text"), ("activity", "text")], name="log_text")
+    if retention_seconds and not LOGS_TIME_SERIES:
+        # MongoDB's TTL monitor deletes expired logs in the background
+        logs_collection.create_index("timestamp", expireAfterSeconds=retention_seconds)
     logger.info("Connected to MongoDB and initialized logs collection")
 except Exception as e:
     logger.error(f"Error connecting to MongoDB: {e}")
     raise
 
-# Store logs in MongoDB
-def store_logs(agent_id, logs):
+# Parse an agent timestamp into UTC, falling back to the time it was received.
+# Logs are stored in UTC, which is what MongoDB's TTL monitor and date operators assume.
+def parse_timestamp(value):
     try:
-        log_documents = [
-            {
-                'agent_id': agent_id,
-                'timestamp': log['timestamp'],
-                'activity': log['activity'],
-                'details': log['details'],
-                'anomaly_score': float(log['anomaly_score']),  # Ensure float
-                'alerts': json.dumps(log.get('alerts', []))  # Store as JSON string
-            }
-            for log in logs
-        ]
-        if log_documents:
-            logs_collection.insert_many(log_documents)
-        logger.info(f"Stored {len(logs)} logs for agent {agent_id} in MongoDB")
-    except Exception as e:
-        logger.error(f"Error storing logs in MongoDB: {e}")
+        return datetime.strptime(value, TIMESTAMP_FORMAT).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        return datetime.now(timezone.utc).replace(microsecond=0)
+
+# Stored dates come back from MongoDB as naive UTC; shown in local time
+def local_time(timestamp):
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone().strftime(TIMESTAMP_FORMAT)
+
+# Build the MongoDB document for a log entry
+def make_log_document(agent_id, session_id, log):
+    return {
+        'agent_id': agent_id,
+        'session_id': session_id,
+        'timestamp': parse_timestamp(log['timestamp']),
+        'activity': log['activity'],
+        'details': log['details'],
+        'anomaly_score': float(log['anomaly_score']),  # Ensure float
+        'alerts': list(log.get('alerts', [])),
+        'seq': log.get('seq')
+    }
+
+# Convert a stored log back to the format agents and the dashboard use
+def decode_log_document(doc):
+    timestamp, alerts = doc['timestamp'], doc['alerts']
+    return {
+        'timestamp': local_time(timestamp) if isinstance(timestamp, datetime) else timestamp,
+        'activity': doc['activity'],
+        'details': doc['details'],
+        'anomaly_score': doc['anomaly_score'],
+        'alerts': json.loads(alerts) if isinstance(alerts, str) else alerts  # Not yet migrated
+    }
+
+# Parse a time from the history API into UTC: agent format, ISO 8601 or a
+# date. Times without an offset are local, like the timestamps logs show.
+def parse_query_time(value):
+    for time_format in ("%Y-%m-%dT%H:%M:%S%z", TIMESTAMP_FORMAT, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, time_format).astimezone(timezone.utc)
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized time '{value}'; use YYYY-MM-DD[THH:MM:SS[+HH:MM|Z]]")
+
+# Build the MongoDB filter for the history API's query parameters
+def build_log_filter(args):
+    query = {}
+    agent_ids = [agent_id for value in args.getlist('agent') for agent_id in value.split(',') if agent_id]
+    if agent_ids:
+        query['agent_id'] = agent_ids[0] if len(agent_ids) == 1 else {'$in': agent_ids}
+    time_range = {}
+    if args.get('since'):
+        time_range['$gte'] = parse_query_time(args['since'])
+    if args.get('until'):
+        time_range['$lte'] = parse_query_time(args['until'])
+    if time_range:
+        query['timestamp'] = time_range
+    if args.get('activity'):
+        query['activity'] = args['activity']
+    if args.get('alert'):
+        query['alerts'] = args['alert']
+    elif args.get('has_alerts') in ('1', 'true'):
+        query['alerts.0'] = {'$exists': True}
+    if args.get('min_score'):
+        try:
+            query['anomaly_score'] = {'$gte': float(args['min_score'])}
+        except ValueError:
+            raise ValueError("min_score must be a number")
+    if args.get('q'):
+        query['$text'] = {'$search': args['q']}
+    return query
+
+# Keyset cursors: the (timestamp, _id) of the last log on a page
+def encode_cursor(doc):
+    timestamp = doc['timestamp']
+    key = [timestamp.isoformat() if isinstance(timestamp, datetime) else None, str(doc['_id'])]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def after_cursor(query, cursor):
+    """Restrict query to logs sorted after the cursor's log."""
+    try:
+        timestamp, object_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        timestamp = datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc) if timestamp else None
+        object_id = ObjectId(object_id)
+    except (ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+    if timestamp is None:
+        after = {'_id': {'$lt': object_id}}  # Not yet migrated string timestamp
+    else:
+        after = {'$or': [{'timestamp': {'$lt': timestamp}}, {'timestamp': timestamp, '_id': {'$lt': object_id}}]}
+    return {'$and': [query, after]} if query else after
+
+# Write-behind queue that batches log inserts from all agents into unordered
+# bulk writes. An agent's logs are acknowledged only once they are written.
+class LogWriteQueue:
+    def __init__(self, flush_interval=WRITE_FLUSH_INTERVAL, flush_size=WRITE_FLUSH_SIZE, max_logs=WRITE_QUEUE_MAX_LOGS):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_logs = max_logs
+        self.documents = []
+        self.cursors = {}  # agent_id -> (session_id, highest queued seq)
+        self.metrics = {
+            'queued': 0,
+            'rejected': 0,
+            'written': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0
+        }
+
+    def start(self):
+        socketio.start_background_task(self.run)
+
+    def put(self, agent_id, session_id, logs, through_seq=None):
+        """Queue logs for writing; returns False when the queue is full.
+
+        Once written, the agent's logs up to through_seq are acknowledged too,
+        including any that were dropped rather than queued.
+        """
+        documents = [make_log_document(agent_id, session_id, log) for log in logs]
+        seqs = [log['seq'] for log in logs if log.get('seq') is not None]
+        if through_seq is not None:
+            seqs.append(through_seq)
+        with self.lock:
+            if len(self.documents) + len(documents) > self.max_logs:
+                self.metrics['rejected'] += len(documents)
+                return False
+            self.documents.extend(documents)
+            self.metrics['queued'] += len(documents)
+            if seqs:
+                self.cursors[agent_id] = (session_id, max(seqs))
+            depth = len(self.documents)
+        if depth >= self.flush_size:
+            self.wakeup.set()
+        return True
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            documents, self.documents = self.documents, []
+            cursors, self.cursors = self.cursors, {}
+        if not documents and not cursors:
+            return
+        start = time.perf_counter()
+        try:
+            if documents:
+                with metrics.timer('store_logs'):
+                    logs_collection.insert_many(documents, ordered=False)
+            failed = []
+        except BulkWriteError as e:
+            # A duplicate _id means a retried document was already written
+            failed_indexes = {error['index'] for error in e.details.get('writeErrors', []) if error.get('code') != 11000}
+            failed = [document for i, document in enumerate(documents) if i in failed_indexes]
+        except Exception as e:
+            logger.error(f"Error writing logs to MongoDB: {e}")
+            failed = documents
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.inc('logs_written', len(documents) - len(failed))
+
+        with self.lock:
+            self.metrics['flushes'] += 1
+            self.metrics['written'] += len(documents) - len(failed)
+            self.metrics['last_flush_ms'] = elapsed_ms
+            self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], elapsed_ms)
+            if failed:
+                # Retry with the next flush and hold back every ack in this batch
+                self.metrics['failed_flushes'] += 1
+                self.documents[:0] = failed
+                for agent_id, cursor in cursors.items():
+                    self.cursors.setdefault(agent_id, cursor)
+                return
+
+        for agent_id, (session_id, seq) in cursors.items():
+            agent = agents.get(agent_id)
+            if agent and agent['session_id'] == session_id:
+                agent['acked_seq'] = max(agent['acked_seq'], seq)
+        throttled_log.info('flush', f"Wrote {len(documents)} logs from {len(cursors)} agents in {elapsed_ms:.1f} ms")
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, depth=len(self.documents))
 
 # Get recent 25 logs for an agent
+@metrics.timed('get_recent_logs')
 def get_recent_logs(agent_id):
     try:
         logs = []
-        cursor = logs_collection.find({'agent_id': agent_id}).sort('timestamp', -1).limit(25)
+        cursor = logs_collection.find({'agent_id': agent_id}).sort('timestamp', -1).limit(RECENT_LOGS_LIMIT)
         for doc in cursor:
-            logs.append({
-                'timestamp': doc['timestamp'],
-                'activity': doc['activity'],
-                'details': doc['details'],
-                'anomaly_score': doc['anomaly_score'],
-                'alerts': json.loads(doc['alerts'])
-            })
-        logger.info(f"Retrieved {len(logs)} recent logs for agent {agent_id} from MongoDB")
+            logs.append(decode_log_document(doc))
+        throttled_log.info('recent_logs', f"Retrieved {len(logs)} recent logs for agent {agent_id} from MongoDB")
         return logs
     except Exception as e:
         logger.error(f"Error retrieving logs from MongoDB: {e}")
         return []
 
-# In-memory storage for agents
+# The fields of a log the dashboard shows
+def display_log(log):
+    return {
+        'timestamp': log['timestamp'],
+        'activity': log['activity'],
+        'details': log['details'],
+        'anomaly_score': float(log['anomaly_score']),
+        'alerts': log.get('alerts', [])
+    }
+
+# Bounded per-agent cache of recent decoded logs, kept current from incoming
+# updates so the update path never reads back from MongoDB
+class RecentLogCache:
+    def __init__(self, limit=RECENT_LOGS_LIMIT):
+        self.lock = threading.Lock()
+        self.limit = limit
+        self.logs = {}  # agent_id -> deque of logs, oldest first
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, agent_id, new_logs):
+        """Add an agent's new logs and return its recent logs, newest first."""
+        with self.lock:
+            cached = self.logs.get(agent_id)
+            if cached is not None:
+                self.hits += 1
+        if cached is None:
+            # Cold start: hydrate from MongoDB once per agent
+            hydrated = deque(reversed(get_recent_logs(agent_id)), maxlen=self.limit)
+            with self.lock:
+                self.misses += 1
+                cached = self.logs.setdefault(agent_id, hydrated)
+        with self.lock:
+            cached.extend(display_log(log) for log in new_logs)
+            return list(reversed(cached))
+
+    def stats(self):
+        with self.lock:
+            return {'agents': len(self.logs), 'hits': self.hits, 'misses': self.misses}
+
+# Coalesces agent changes and alerts into one rate-limited frame for the
+# dashboard room, sending only the fields that changed since the last frame
+class DashboardBroadcaster:
+    def __init__(self, interval=DASHBOARD_FRAME_INTERVAL, alert_cooldown=ALERT_COOLDOWN):
+        self.lock = threading.Lock()
+        self.interval = interval
+        self.alert_cooldown = alert_cooldown
+        self.sent = {}  # agent_id -> field values dashboards already have
+        self.changes = {}  # agent_id -> fields changed since the last frame
+        self.alerts = {}  # (agent_id, activity) -> alert message for the next frame
+        self.alerted_at = {}  # (agent_id, activity) -> time the alert was last queued
+        self.frames = 0
+
+    def start(self):
+        socketio.start_background_task(self.run)
+
+    def forget(self, agent_id):
+        """Send every field of a (re)registered agent in the next frame."""
+        with self.lock:
+            self.sent.pop(agent_id, None)
+
+    def update(self, agent_id, fields, new_logs):
+        now = time.monotonic()
+        with self.lock:
+            sent = self.sent.setdefault(agent_id, {})
+            changed = {key: value for key, value in fields.items() if key not in sent or sent[key] != value}
+            sent.update(changed)
+            if changed or new_logs:
+                pending = self.changes.setdefault(agent_id, {})
+                pending.update(changed)
+                if new_logs:
+                    logs = pending.setdefault('new_logs', [])
+                    logs.extend(display_log(log) for log in new_logs)
+                    del logs[:-RECENT_LOGS_LIMIT]
+            for log in new_logs:
+                if log['anomaly_score'] > 0.3:
+                    self._queue_alert(agent_id, log['activity'], f"Suspicious activity detected on {agent_id}: {log['activity']}", now)
+
+    def alert(self, agent_id, activity, message):
+        with self.lock:
+            self._queue_alert(agent_id, activity, message, time.monotonic())
+
+    def _queue_alert(self, agent_id, activity, message, now):
+        key = (agent_id, activity)
+        if now - self.alerted_at.get(key, float('-inf')) >= self.alert_cooldown:
+            self.alerted_at[key] = now
+            self.alerts[key] = message
+
+    def run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error sending dashboard update: {e}")
+
+    def flush(self):
+        with self.lock:
+            changes, self.changes = self.changes, {}
+            alerts, self.alerts = self.alerts, {}
+        if not changes and not alerts:
+            return
+        self.frames += 1
+        with metrics.timer('emit_fanout'):
+            socketio.emit('dashboard_update', {'agents': changes, 'alerts': list(alerts.values())}, to=DASHBOARD_ROOM)
+        metrics.inc('dashboard_frames')
+        metrics.inc('alerts', len(alerts))
+        for (agent_id, activity), message in alerts.items():
+            logger.warning(f"Alert emitted for agent {agent_id}: {activity}")
+
+# Sliding-window totals of anomaly scores kept in fixed time buckets, so
+# adding an event and expiring old ones are both O(1)
+class SlidingWindow:
+    __slots__ = ('bucket_seconds', 'scores', 'events', 'anomalies', 'bucket', 'score_sum', 'event_count', 'anomaly_count')
+
+    def __init__(self, seconds, buckets=RISK_WINDOW_BUCKETS):
+        self.bucket_seconds = seconds / buckets
+        self.scores = [0.0] * buckets
+        self.events = [0] * buckets
+        self.anomalies = [0] * buckets
+        self.bucket = None
+        self.score_sum = 0.0
+        self.event_count = 0
+        self.anomaly_count = 0
+
+    def advance(self, now):
+        """Expire the buckets that have slid out of the window."""
+        bucket = int(now // self.bucket_seconds)
+        if self.bucket is None:
+            self.bucket = bucket
+            return
+        size = len(self.scores)
+        for b in range(self.bucket + 1, min(bucket, self.bucket + size) + 1):
+            i = b % size
+            self.score_sum -= self.scores[i]
+            self.event_count -= self.events[i]
+            self.anomaly_count -= self.anomalies[i]
+            self.scores[i] = 0.0
+            self.events[i] = self.anomalies[i] = 0
+        if self.event_count == 0:
+            self.score_sum = 0.0  # Reset float drift whenever the window empties
+        self.bucket = max(self.bucket, bucket)
+
+    def add(self, score_sum, event_count, anomaly_count):
+        i = self.bucket % len(self.scores)
+        self.scores[i] += score_sum
+        self.events[i] += event_count
+        self.anomalies[i] += anomaly_count
+        self.score_sum += score_sum
+        self.event_count += event_count
+        self.anomaly_count += anomaly_count
+
+# Rolling anomaly statistics for one agent
+class AgentRisk:
+    __slots__ = ('windows', 'ewma', 'last_event', 'peer_value')
+
+    def __init__(self):
+        self.windows = {name: SlidingWindow(seconds) for name, seconds in RISK_WINDOWS.items()}
+        self.ewma = 0.0
+        self.last_event = None
+        self.peer_value = 0.0  # This agent's contribution to the fleet totals
+
+# Keeps per-agent rolling windows and fleet-wide running totals, so an agent's
+# deviation from its peers is updated in O(1) per event
+class AnomalyAggregator:
+    def __init__(self, peer_window=PEER_WINDOW, half_life=RISK_EWMA_HALF_LIFE):
+        self.lock = threading.Lock()
+        self.peer_window = peer_window
+        self.decay = math.log(2) / half_life
+        self.agents = {}
+        self.fleet_sum = 0.0
+        self.fleet_sum_sq = 0.0
+
+    def _set_peer_value(self, risk, value):
+        self.fleet_sum += value - risk.peer_value
+        self.fleet_sum_sq += value * value - risk.peer_value * risk.peer_value
+        risk.peer_value = value
+
+    def _advance(self, risk, now):
+        for window in risk.windows.values():
+            window.advance(now)
+        self._set_peer_value(risk, risk.windows[self.peer_window].score_sum)
+
+    def _deviation(self, value):
+        n = len(self.agents)
+        if n < 2:
+            return 0.0
+        mean = self.fleet_sum / n
+        std = math.sqrt(max(self.fleet_sum_sq / n - mean * mean, 0.0))
+        return (value - mean) / std if std > 1e-9 else 0.0
+
+    def _summary(self, risk):
+        return {
+            'ewma': round(risk.ewma, 4),
+            'windows': {
+                name: {'score_sum': round(window.score_sum, 4), 'events': window.event_count, 'anomalies': window.anomaly_count}
+                for name, window in risk.windows.items()
+            },
+            'peer_deviation': round(self._deviation(risk.peer_value), 4)
+        }
+
+    def add(self, agent_id, logs, now=None):
+        """Fold an agent's new logs into its windows and return its risk summary."""
+        now = time.time() if now is None else now
+        with self.lock:
+            risk = self.agents.get(agent_id)
+            if risk is None:
+                risk = self.agents[agent_id] = AgentRisk()
+            for window in risk.windows.values():
+                window.advance(now)
+            if logs:
+                scores = [float(log['anomaly_score']) for log in logs]
+                anomaly_count = sum(1 for score in scores if score > 0.3)
+                for window in risk.windows.values():
+                    window.add(sum(scores), len(scores), anomaly_count)
+                # Time-decayed average: older scores lose weight with elapsed time
+                if risk.last_event is None:
+                    risk.ewma = sum(scores) / len(scores)
+                else:
+                    weight = math.exp(-self.decay * (now - risk.last_event))
+                    risk.ewma = weight * risk.ewma + (1 - weight) * (sum(scores) / len(scores))
+                risk.last_event = now
+            self._set_peer_value(risk, risk.windows[self.peer_window].score_sum)
+            return self._summary(risk)
+
+    def remove(self, agent_id):
+        with self.lock:
+            risk = self.agents.pop(agent_id, None)
+            if risk is not None:
+                self._set_peer_value(risk, 0.0)
+
+    def top_outliers(self, limit=20, now=None):
+        """Rank agents by peer deviation, expiring idle agents' windows first."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for risk in self.agents.values():
+                self._advance(risk, now)
+            # Recompute the fleet totals to drop accumulated float error
+            self.fleet_sum = sum(risk.peer_value for risk in self.agents.values())
+            self.fleet_sum_sq = sum(risk.peer_value * risk.peer_value for risk in self.agents.values())
+            ranked = heapq.nlargest(limit, self.agents.items(), key=lambda item: item[1].peer_value)
+            return [dict(self._summary(risk), agent_id=agent_id) for agent_id, risk in ranked]
+
+# Logs the model scored under their agent's threshold aren't kept; returns the rest
+def apply_thresholds(logs):
+    return [log for log in logs if log.get('threshold') is None or log['anomaly_score'] > log['threshold']]
+
+# Fold an agent's newly accepted logs into its recent logs, risk and anomaly count
+def record_logs(agent, logs):
+    recent_logs = recent_logs_cache.update(agent['agent_id'], logs)
+    risk = anomaly_aggregator.add(agent['agent_id'], logs)
+    agent.update({
+        # Agents only send new logs, so accumulate the analysis here
+        'behavior_anomalies': agent['behavior_anomalies'] + sum(1 for log in logs if log['anomaly_score'] > 0.3),
+        'total_logs': len(recent_logs),
+        'peer_deviation': risk['peer_deviation'],  # Standard deviations above the fleet mean
+        'risk': risk,
+        'logs': recent_logs
+    })
+
+# Scores the feature vectors of agents in SCORING_MODE "server". Their updates
+# are queued whole; workers gather rows from every agent into one batch and
+# score it with the current model. Scored updates go to the write queue in
+# the order they were submitted, so an agent's acked_seq never passes logs
+# still being scored. The agent's state and dashboard are updated with them
+# on its next log_update, by the handler, which owns the agent's dict.
+#
+# Every worker process polls the model file and loads it when it changes;
+# replace it atomically (install_model) to switch models everywhere.
+class ScoringService:
+    def __init__(self, model_file=SCORING_MODEL_FILE, workers=SCORING_WORKERS, batch_rows=SCORING_BATCH_ROWS,
+                 max_wait=SCORING_BATCH_WAIT, max_rows=SCORING_QUEUE_MAX_ROWS, poll_interval=MODEL_POLL_INTERVAL):
+        self.lock = threading.Lock()
+        self.forward_lock = threading.Lock()  # One worker at a time hands updates on, in order
+        self.wakeup = threading.Event()
+        self.model_file = model_file
+        self.workers = workers
+        self.batch_rows = batch_rows
+        self.max_wait = max_wait
+        self.max_rows = max_rows
+        self.poll_interval = poll_interval
+        self.pending = deque()  # (ticket, agent_id, session_id, logs, through_seq) waiting to be scored
+        self.pending_rows = 0
+        self.next_ticket = 0  # Given to updates in submission order
+        self.next_forward = 0  # Ticket of the next update to hand to the write queue
+        self.scored = {}  # ticket -> scored update waiting for its turn or for room in the write queue
+        self.results = {}  # agent_id -> [(session_id, logs)] written but not yet applied to the agent
+        self.model = None  # Replaced wholesale on a swap, never modified
+        self.model_stat = None  # (mtime, size) of the model file when it was loaded
+        self.metrics = {
+            'batches': 0,
+            'rows': 0,
+            'skipped': 0,
+            'below_threshold': 0,
+            'rejected': 0,
+            'model_swaps': 0,
+            'load_errors': 0,
+            'scoring_seconds': 0.0,
+            'last_batch_rows': 0,
+            'last_batch_ms': 0.0
+        }
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def start(self):
+        self.reload()
+        socketio.start_background_task(self.watch)
+        for _ in range(self.workers):
+            socketio.start_background_task(self.run)
+
+    def load(self, path):
+        """Switch to the model at path; raises if it can't be loaded."""
+        model = FlatForest(path)
+        previous, self.model = self.model, model
+        with self.lock:
+            self.metrics['model_swaps'] += previous is not None
+        logger.info(f"Scoring with model {model.version or 'unversioned'} from {path}")
+
+    def reload(self):
+        """Load the model file if it changed since it was last loaded."""
+        try:
+            stat = os.stat(self.model_file)
+        except FileNotFoundError:
+            return
+        if (stat.st_mtime_ns, stat.st_size) == self.model_stat:
+            return
+        try:
+            self.load(self.model_file)
+            self.model_stat = (stat.st_mtime_ns, stat.st_size)
+        except Exception as e:
+            # Usually a file caught mid-copy; keep scoring with the current model
+            with self.lock:
+                self.metrics['load_errors'] += 1
+            logger.warning(f"Could not load {self.model_file}, retrying in {self.poll_interval}s: {e}")
+
+    def watch(self):
+        while True:
+            socketio.sleep(self.poll_interval)
+            self.reload()
+
+    def submit(self, agent_id, session_id, logs, through_seq):
+        """Queue an update's logs for scoring; returns False when the queue is full."""
+        with self.lock:
+            if self.pending_rows + len(logs) > self.max_rows:
+                self.metrics['rejected'] += len(logs)
+                return False
+            self.pending.append((self.next_ticket, agent_id, session_id, logs, through_seq))
+            self.next_ticket += 1
+            self.pending_rows += len(logs)
+            rows = self.pending_rows
+        if rows >= self.batch_rows:
+            self.wakeup.set()
+        return True
+
+    def take(self):
+        with self.lock:
+            items = []
+            rows = 0
+            while self.pending and rows < self.batch_rows:
+                items.append(self.pending.popleft())
+                rows += len(items[-1][3])
+            self.pending_rows -= rows
+        return items
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.max_wait)
+            self.wakeup.clear()
+            self.forward()
+            items = self.take()
+            while items:
+                self.score(items)
+                self.forward()
+                items = self.take()
+
+    def score(self, items):
+        model = self.model
+        candidates = [log for item in items for log in item[3] if log.get('features') is not None]
+        rows = [log for log in candidates if model is not None and len(log['features']) == model.n_features_in_]
+        start = time.perf_counter()
+        scored = 0
+        if rows:
+            try:
+                with metrics.timer('score_batch'):
+                    anomaly_scores, suspicious = model.anomaly_scores(np.array([log['features'] for log in rows], dtype=np.float32))
+                for log, score, outlier in zip(rows, anomaly_scores.tolist(), suspicious.tolist()):
+                    # The agent already applied its rules: a 0.5 floor and their alerts
+                    log['anomaly_score'] = max(log['anomaly_score'], score)
+                    if outlier:
+                        log['alerts'] = ["Suspicious activity"] + list(log['alerts'])
+                    log['scored'] = True
+                scored = len(rows)
+            except Exception as e:
+                logger.error(f"Error scoring batch of {len(rows)} rows: {e}")
+        elapsed = time.perf_counter() - start
+        metrics.inc('score_batches')
+        metrics.inc('scored_rows', scored)
+
+        below_threshold = 0
+        results = {}
+        for ticket, agent_id, session_id, logs, through_seq in items:
+            for log in logs:
+                # Only the model's score is checked against the threshold; logs it
+                # couldn't score keep their rule score and are stored
+                if not log.pop('scored', False):
+                    log.pop('threshold', None)
+                log.pop('features', None)
+            kept = apply_thresholds(logs)
+            for log in kept:
+                log.pop('threshold', None)
+            below_threshold += len(logs) - len(kept)
+            results[ticket] = (agent_id, session_id, kept, through_seq)
+        with self.lock:
+            self.scored.update(results)
+            self.metrics['batches'] += 1
+            self.metrics['rows'] += scored
+            self.metrics['skipped'] += len(candidates) - scored
+            self.metrics['below_threshold'] += below_threshold
+            self.metrics['scoring_seconds'] += elapsed
+            self.metrics['last_batch_rows'] = scored
+            self.metrics['last_batch_ms'] = elapsed * 1000
+
+    def forward(self):
+        """Pass scored updates to the write queue in submission order, holding them while it's full."""
+        if not self.forward_lock.acquire(blocking=False):
+            return  # Another worker is forwarding and will pick these up
+        try:
+            while True:
+                with self.lock:
+                    item = self.scored.get(self.next_forward)
+                if item is None:
+                    return  # Not scored yet; later tickets wait behind it
+                agent_id, session_id, logs, through_seq = item
+                if not write_queue.put(agent_id, session_id, logs, through_seq):
+                    return  # Retried on the next wakeup
+                with self.lock:
+                    del self.scored[self.next_forward]
+                    self.next_forward += 1
+                    if logs:
+                        self.results.setdefault(agent_id, []).append((session_id, logs))
+        finally:
+            self.forward_lock.release()
+
+    def collect(self, agent_id, session_id):
+        """Take the scored logs written for an agent since the last call."""
+        with self.lock:
+            results = self.results.pop(agent_id, [])
+        return [log for result_session, logs in results if result_session == session_id for log in logs]
+
+    def stats(self):
+        with self.lock:
+            seconds = self.metrics['scoring_seconds']
+            return dict(self.metrics,
+                        rows_per_second=self.metrics['rows'] / seconds if seconds else 0.0,
+                        queued_rows=self.pending_rows,
+                        waiting_for_write=len(self.scored),
+                        model_version=self.model.version if self.model else None,
+                        model_loaded=self.model is not None)
+
+# Agents connected to this worker, and the registry shared by all workers
 agents = {}
+agent_store = create_agent_store(SHARED_STATE_URL)
+recent_logs_cache = RecentLogCache()
+
+write_queue = LogWriteQueue()
+write_queue.start()
+dashboard_broadcaster = DashboardBroadcaster()
+dashboard_broadcaster.start()
+anomaly_aggregator = AnomalyAggregator()
+scoring_service = ScoringService()
+scoring_service.start()
+metrics.start_summary(logger, METRICS_SUMMARY_INTERVAL, sleep=socketio.sleep, spawn=socketio.start_background_task)
+if profiler:
+    profiler.start()
+baseline_registry = BaselineRegistry(BASELINE_DIR, BASELINE_CACHE_SIZE)
+if not baseline_registry.available:
+    logger.warning(f"No baselines in {BASELINE_DIR}/; per-entity scoring is off")
+
+# One page of agents ordered by ID, starting after the given ID
+def page_agents(after, limit):
+    page = sorted((agent for agent in agent_store.all() if agent['agent_id'] > after), key=lambda agent: agent['agent_id'])
+    next_after = page[limit - 1]['agent_id'] if len(page) > limit else None
+    return page[:limit], next_after
 
 # Routes
 @app.route('/')
@@ -73,7 +838,10 @@ def index():
     if 'username' not in session:
         return redirect(url_for('login'))
     logger.info("Rendering dashboard")
-    return render_template('dashboard.html', agents=agents.values(), current_time=datetime.now().strftime("%H:%M:%S"))
+    after = request.args.get('after', '')
+    agents_page, next_after = page_agents(after, AGENT_PAGE_SIZE)
+    return render_template('dashboard.html', agents=agents_page, next_after=next_after, first_page=not after,
+                           recent_logs_limit=RECENT_LOGS_LIMIT, current_time=datetime.now().strftime("%H:%M:%S"))
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -95,66 +863,274 @@ def logout():
     logger.info(f"User {username} logged out")
     return redirect(url_for('login'))
 
+@app.route('/stats')
+def stats():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    return jsonify({'write_queue': write_queue.stats(), 'recent_logs_cache': recent_logs_cache.stats(),
+                    'baselines': baseline_registry.stats(), 'scoring': scoring_service.stats()})
+
+# Prometheus metrics for this worker; open to logged-in users and local scrapers
+@app.route('/metrics')
+def metrics_endpoint():
+    local = request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+    if not local and 'username' not in session:
+        return redirect(url_for('login'))
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+# Collapsed stacks from the sampling profiler (THREXEL_PROFILE=1)
+@app.route('/profile')
+def profile_endpoint():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    if profiler is None:
+        return "Profiler not enabled; set THREXEL_PROFILE=1 (threading mode only)\n", 404, {'Content-Type': 'text/plain'}
+    return profiler.collapsed(), 200, {'Content-Type': 'text/plain'}
+
+@app.route('/api/outliers')
+def outliers():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'agents': anomaly_aggregator.top_outliers(max(1, min(limit, 1000)))})
+
+@app.route('/api/agents')
+def agent_list():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    limit = max(1, min(request.args.get('limit', AGENT_PAGE_SIZE, type=int), LOG_PAGE_MAX))
+    agents_page, next_after = page_agents(request.args.get('after', ''), limit)
+    fields = ('agent_id',) + DASHBOARD_FIELDS
+    return jsonify({'agents': [{field: agent.get(field) for field in fields} for agent in agents_page],
+                    'next_after': next_after})
+
+# Log history, newest first. Filters: agent (repeatable or comma-separated),
+# since/until (inclusive), activity, alert, has_alerts, min_score and q (text
+# search of details and activity). Pass a page's next_cursor to get the next.
+@app.route('/api/logs')
+def log_history():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    limit = max(1, min(request.args.get('limit', LOG_PAGE_SIZE, type=int), LOG_PAGE_MAX))
+    try:
+        query = build_log_filter(request.args)
+        if request.args.get('cursor'):
+            query = after_cursor(query, request.args['cursor'])
+        docs = list(logs_collection.find(query, {'session_id': 0})
+                    .sort([('timestamp', -1), ('_id', -1)])
+                    .limit(limit + 1)
+                    .max_time_ms(LOG_QUERY_MAX_TIME_MS))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except ExecutionTimeout:
+        return jsonify({'error': "Query took too long; narrow the filters"}), 504
+    except Exception as e:
+        logger.error(f"Error querying log history: {e}")
+        return jsonify({'error': "Log query failed"}), 500
+    logs = [dict(decode_log_document(doc), agent_id=doc['agent_id'], seq=doc.get('seq')) for doc in docs[:limit]]
+    return jsonify({'logs': logs, 'next_cursor': encode_cursor(docs[limit - 1]) if len(docs) > limit else None})
+
+# Group keys for /api/logs/aggregate; 'alert' counts each alert of a log
+# separately. Hours and days are UTC.
+LOG_GROUP_KEYS = {
+    'agent': '$agent_id',
+    'activity': '$activity',
+    'alert': '$alerts',
+    'hour': {'$dateToString': {'format': '%Y-%m-%dT%H:00:00Z', 'date': '$timestamp'}},
+    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$timestamp'}}
+}
+
+# Log counts per group, e.g. ?group=agent,hour&has_alerts=1 for alerts per
+# hour per agent. Takes the same filters as /api/logs.
+@app.route('/api/logs/aggregate')
+def log_aggregate():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    group = [key for key in request.args.get('group', 'agent,hour').split(',') if key]
+    unknown = [key for key in group if key not in LOG_GROUP_KEYS]
+    if unknown or not group:
+        return jsonify({'error': f"group must be a comma-separated list of {', '.join(LOG_GROUP_KEYS)}"}), 400
+    try:
+        pipeline = [{'$match': build_log_filter(request.args)}]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'alert' in group:
+        pipeline.append({'$unwind': '$alerts'})
+        alert_count = 1
+    else:
+        alert_count = {'$cond': [{'$isArray': '$alerts'}, {'$size': '$alerts'}, 0]}
+    pipeline += [
+        {'$group': {
+            '_id': {key: LOG_GROUP_KEYS[key] for key in group},
+            'logs': {'$sum': 1},
+            'alerts': {'$sum': alert_count},
+            'suspicious': {'$sum': {'$cond': [{'$gt': ['$anomaly_score', 0.3]}, 1, 0]}},
+            'max_score': {'$max': '$anomaly_score'}
+        }},
+        {'$sort': {f'_id.{key}': 1 for key in group}},
+        {'$limit': AGGREGATE_MAX_GROUPS + 1}
+    ]
+    try:
+        results = list(logs_collection.aggregate(pipeline, allowDiskUse=True, maxTimeMS=LOG_QUERY_MAX_TIME_MS))
+    except ExecutionTimeout:
+        return jsonify({'error': "Aggregation took too long; narrow the filters"}), 504
+    except Exception as e:
+        logger.error(f"Error aggregating logs: {e}")
+        return jsonify({'error': "Log aggregation failed"}), 500
+    groups = [dict(result['_id'], logs=result['logs'], alerts=result['alerts'], suspicious=result['suspicious'],
+                   max_score=result['max_score']) for result in results[:AGGREGATE_MAX_GROUPS]]
+    return jsonify({'group': group, 'groups': groups, 'truncated': len(results) > AGGREGATE_MAX_GROUPS})
+
+# The model the scoring service uses in this worker. POST {"version": ...}
+# installs models/anomaly_model-<version>.npz as the model file, which every
+# worker loads within MODEL_POLL_INTERVAL; this one loads it straight away.
+@app.route('/api/model', methods=['GET', 'POST'])
+def scoring_model():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    if request.method == 'POST':
+        version = (request.get_json(silent=True) or request.form).get('version', '')
+        if not re.fullmatch(r'[\w.-]+', version):
+            return jsonify({'error': "version is required"}), 400
+        path = os.path.join(SCORING_MODEL_DIR, f"anomaly_model-{version}.npz")
+        if not os.path.exists(path):
+            return jsonify({'error': f"No model {version} in {SCORING_MODEL_DIR}/"}), 404
+        try:
+            FlatForest(path)  # Don't install a model that can't be loaded
+            install_model(path, SCORING_MODEL_FILE)
+            scoring_service.reload()
+        except Exception as e:
+            logger.error(f"Error loading model {version}: {e}")
+            return jsonify({'error': f"Could not load model {version}"}), 500
+    return jsonify(scoring_service.stats())
+
 @app.route('/change_credentials')
 def change_credentials():
     logger.info("Accessed change credentials page")
     return "Change credentials page (not implemented)"
 
 # WebSocket events
+@socketio.on('connect')
+def handle_connect():
+    # Only logged-in dashboards receive agent updates; agents have no session
+    if 'username' in session:
+        join_room(DASHBOARD_ROOM)
+
 @socketio.on('register_agent')
 def handle_register_agent(data):
     agent_id = data['agent_id']
+    if traffic_recorder:
+        traffic_recorder.record('register_agent', agent_id, data)
+    session_id = data.get('session_id')
+    # Keep the ack cursors across reconnects of the same agent session. On a
+    # different worker, restart from acked_seq: the previous worker's queued
+    # logs can only be acked there.
+    previous = agents.get(agent_id)
+    if previous is None:
+        previous = agent_store.get(agent_id)
+        if previous:
+            previous = dict(previous, queued_seq=previous['acked_seq'])
+    same_session = previous and previous['session_id'] == session_id
     agents[agent_id] = {
         'agent_id': agent_id,
+        'session_id': session_id,
+        'queued_seq': previous['queued_seq'] if same_session else 0,  # Highest seq accepted for writing
+        'acked_seq': previous['acked_seq'] if same_session else 0,  # Highest seq written to MongoDB
         'system_name': data['system_name'],
         'version': data['version'],
         'current_user': data['current_user'],
+        'employee_id': data.get('employee_id'),  # Sent by agents with EMPLOYEE_ID set
         'status': data['status'],
         'data_usage': 0,
         'behavior_anomalies': 0,
         'total_logs': 0,
         'peer_deviation': 0,
+        'risk': None,
+        'baseline': None,
+        'process_io': [],  # Busiest processes by IO, from the agent's latest update
+        'scoring': 'server' if data.get('scoring') == 'server' and scoring_service.available else None,
         'logs': []
     }
     logger.info(f"Agent {agent_id} registered")
-    emit('agent_registered', agents[agent_id], broadcast=True)
+    agent_store.set(agent_id, agents[agent_id])
+    dashboard_broadcaster.forget(agent_id)
+    emit('agent_registered', {'agent_id': agent_id}, to=DASHBOARD_ROOM)  # Its fields follow in the next frame
+    # Either format is always accepted; this only tells the agent it may switch
+    return {'wire_format': PACKED_FORMAT if PACKED_FORMAT in data.get('wire_formats', []) else None,
+            'scoring': agents[agent_id]['scoring']}
 
 @socketio.on('log_update')
+@metrics.timed('log_update')
 def handle_log_update(data):
     try:
+        raw = data
+        if isinstance(data, bytes):
+            data = decode_update(data)  # Leaves out the fields sent at registration
         agent_id = data['agent_id']
+        if traffic_recorder:
+            traffic_recorder.record('log_update', agent_id, raw)
         if agent_id in agents:
-            # Store all logs in MongoDB
-            store_logs(agent_id, data['logs'])
-            
-            # Update agent data with recent 25 logs
-            recent_logs = get_recent_logs(agent_id)
-            agents[agent_id].update({
-                'system_name': data['system_name'],
-                'version': data['version'],
-                'current_user': data['current_user'],
-                'status': data['status'],
+            agent = agents[agent_id]
+            session_id = data.get('session_id')
+            if session_id != agent['session_id']:
+                agent['session_id'] = session_id
+                agent['queued_seq'] = agent['acked_seq'] = 0
+
+            # Skip logs already queued from a resend of unacked logs
+            queued_seq = agent['queued_seq']
+            new_logs = [log for log in data['logs'] if log.get('seq') is None or log['seq'] > queued_seq]
+            seqs = [log['seq'] for log in new_logs if log.get('seq') is not None]
+            through_seq = max(seqs) if seqs else None
+            if new_logs and scoring_service.available and (
+                    agent.get('scoring') or any(log.get('features') is not None for log in new_logs)):
+                # Once one update goes through the scoring service, the rest
+                # follow, so the write queue sees them in order
+                agent['scoring'] = 'server'
+                accepted = scoring_service.submit(agent_id, session_id, new_logs, through_seq)
+                direct_logs = []
+            else:
+                # Without a model, logs keep their rule scores and no threshold applies
+                direct_logs = new_logs
+                accepted = write_queue.put(agent_id, session_id, direct_logs, through_seq)
+            if not accepted:
+                new_logs = direct_logs = []  # Queue full; left unacked so the agent resends them
+            elif through_seq is not None:
+                agent['queued_seq'] = through_seq
+
+            # Update agent data with recent 25 logs, including those scored since the last update
+            shown_logs = scoring_service.collect(agent_id, session_id) + direct_logs
+            record_logs(agent, shown_logs)
+            performance = data.get('performance') or {}
+            baseline = baseline_registry.score(
+                data.get(BASELINE_ENTITY_FIELD, agent.get(BASELINE_ENTITY_FIELD)),
+                {metric: performance.get(metric) for metric in BASELINE_METRICS},
+                hour=datetime.now().hour
+            )
+            agent.update({
+                'system_name': data.get('system_name', agent['system_name']),
+                'version': data.get('version', agent['version']),
+                'current_user': data.get('current_user', agent['current_user']),
+                'status': data.get('status', agent['status']),
                 'data_usage': data['network_traffic']['daily_usage'],
-                'behavior_anomalies': len(data['analysis']['suspicious_patterns']),
-                'total_logs': len(recent_logs),
-                'peer_deviation': data['analysis']['risk_score'],
-                'logs': recent_logs
+                'process_io': data.get('process_io', []),
+                'baseline': baseline  # Deviation from the user's own history; None without a baseline
             })
-            data['logs'] = recent_logs  # Update data sent to dashboard
-            emit('log_update', data, broadcast=True)
-            logger.info(f"Processed log update for agent {agent_id}")
-
-            # Emit alerts if necessary
-            for log in data['logs']:
-                if log['anomaly_score'] > 0.3:
-                    emit('alert', {'message': f"Suspicious activity detected on {agent_id}: {log['activity']}"}, broadcast=True)
-                    logger.warning(f"Alert emitted for agent {agent_id}: {log['activity']}")
+            agent_store.set(agent_id, agent)
+            fields = {field: agent[field] for field in DASHBOARD_FIELDS if field in agent}
+            fields['performance'] = data.get('performance')
+            fields['cpu_trend'] = data.get('cpu_trend')
+            dashboard_broadcaster.update(agent_id, fields, shown_logs)
+            for alert in (baseline['alerts'] if baseline else []):
+                dashboard_broadcaster.alert(agent_id, alert, f"Baseline deviation on {agent_id}: {alert}")
+            metrics.inc('updates_received')
+            metrics.inc('logs_received', len(new_logs))
+            return {'acked_seq': agent['acked_seq'], 'queued_seq': agent['queued_seq']}
     except Exception as e:
         logger.error(f"Error handling log update: {e}")
 
 if __name__ == "__main__":
     try:
-        logger.info("Starting server...")
+        logger.info(f"Starting server in {socketio.async_mode} mode...")
         # For production, Gunicorn will be used; this is for testing
         socketio.run(app, debug=False, host='0.0.0.0', port=5000)
     except Exception as e:
@@ -0,0 +1,272 @@
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Per-entity behavior baselines. Instead of scoring every host against one
+# global forest and fixed working hours/location, each employee (or host)
+# gets a small summary of its own history:
+#   quantiles    p01/p25/p50/p75/p99 of every numeric feature
+#   hour_mask    hours of the day the entity was seen active
+#   locations    places the entity was seen at
+#
+# Build the registry from generated data with
+#   python baselines.py employee_behavior_data.csv
+# Entities are split over SHARDS .npy files of fixed-size records (sorted by
+# entity) by CRC32 of their id. The server memory-maps a shard, binary
+# searches it, and keeps the baselines it looked up in a bounded LRU cache.
+
+# Configuration
+BASELINE_DIR = "baselines"
+SHARDS = 256
+CHUNK_ROWS = 1000000  # Rows read at a time while partitioning
+ENTITY_COLUMN = 'employee_id'
+FEATURES = ['cpu', 'memory_percent', 'disk_percent', 'network_sent', 'network_received', 'process_count']
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+MIN_SPREAD = {'cpu': 5.0, 'memory_percent': 5.0, 'disk_percent': 5.0,  # Floors the IQR used as the scale,
+              'network_sent': 20.0, 'network_received': 20.0, 'process_count': 5.0}  # so flat histories aren't hair-triggers
+ALERT_DEVIATION = 1.5  # IQRs beyond p01/p99 before a feature raises an alert
+CACHE_SIZE = 10000  # Baselines kept in memory by the registry
+
+def shard_of(entity, shards=SHARDS):
+    return zlib.crc32(str(entity).encode('utf-8')) % shards
+
+# One entity's baseline and the scoring against it
+class Baseline:
+    __slots__ = ('entity', 'quantiles', 'hour_mask', 'locations', 'samples')
+
+    def __init__(self, entity, quantiles, hour_mask, locations, samples):
+        self.entity = entity
+        self.quantiles = quantiles  # (features, len(QUANTILES)) array
+        self.hour_mask = hour_mask  # 24 bools
+        self.locations = locations  # frozenset of location names
+        self.samples = samples
+
+    def score(self, values, hour=None, location=None):
+        """Score a dict of feature values; unknown features and None are skipped.
+
+        Returns an anomaly score in [0, 1] (0 inside the entity's p01–p99
+        range, approaching 1 as values move several IQRs outside it) and a
+        list of alerts.
+        """
+        worst = 0.0
+        alerts = []
+        for i, feature in enumerate(FEATURES):
+            value = values.get(feature)
+            if value is None:
+                continue
+            p01, p25, _, p75, p99 = self.quantiles[i]
+            spread = max(p75 - p25, MIN_SPREAD[feature])
+            deviation = max(value - p99, p01 - value, 0.0) / spread
+            worst = max(worst, deviation)
+            if deviation > ALERT_DEVIATION:
+                alerts.append(f"Unusual {feature} for {self.entity}")
+        if hour is not None and not self.hour_mask[hour]:
+            worst = max(worst, ALERT_DEVIATION)
+            alerts.append(f"Usage outside {self.entity}'s usual hours")
+        if location is not None and self.locations and location not in self.locations:
+            worst = max(worst, ALERT_DEVIATION)
+            alerts.append(f"Usage from a location unusual for {self.entity}")
+        return 1.0 - math.exp(-worst), alerts
+
+# Lazily loaded baselines with an LRU cache of at most max_entities
+class BaselineRegistry:
+    def __init__(self, directory=BASELINE_DIR, max_entities=CACHE_SIZE):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.max_entities = max_entities
+        self.cache = OrderedDict()  # entity -> Baseline, or None when it has none
+        self.shards = None
+        self.locations = None
+        self.maps = {}  # shard -> memory-mapped records, or None when it couldn't be loaded; pages load on demand
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'load_errors': 0}
+        index_path = os.path.join(directory, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index['features'] == FEATURES and index['quantiles'] == list(QUANTILES):
+                self.shards = index['shards']
+                self.locations = np.array(index['locations'])
+
+    @property
+    def available(self):
+        return self.shards is not None
+
+    def get(self, entity):
+        """Return the Baseline for entity, or None if it has none."""
+        if self.shards is None or entity is None:
+            return None
+        with self.lock:
+            if entity in self.cache:
+                self.cache.move_to_end(entity)
+                self.metrics['hits'] += 1
+                return self.cache[entity]
+            self.metrics['misses'] += 1
+        baseline = self.load(entity)  # Disk read outside the lock
+        with self.lock:
+            self.cache[entity] = baseline
+            self.cache.move_to_end(entity)
+            while len(self.cache) > self.max_entities:
+                self.cache.popitem(last=False)
+                self.metrics['evictions'] += 1
+        return baseline
+
+    def load(self, entity):
+        shard = shard_of(entity, self.shards)
+        if shard not in self.maps:
+            path = os.path.join(self.directory, f"shard-{shard:03d}.npy")
+            try:
+                self.maps[shard] = np.load(path, mmap_mode='r')
+            except FileNotFoundError:
+                self.maps[shard] = None  # No entity in the registry hashed to this shard
+            except Exception as e:
+                # A corrupt or partly written shard; its entities go unscored until a restart
+                with self.lock:
+                    self.metrics['load_errors'] += 1
+                self.maps[shard] = None
+                logger.error(f"Could not load baseline shard {path}: {e}")
+        records = self.maps[shard]
+        if records is None:
+            return None
+        try:
+            entities = records['entity']
+            row = np.searchsorted(entities, entity)  # Records are sorted by entity
+            if row == len(records) or entities[row] != entity:
+                return None
+            record = records[row]
+            return Baseline(entity, np.array(record['quantiles']), np.array(record['hour_mask']),
+                            frozenset(self.locations[record['location_mask']].tolist()), int(record['samples']))
+        except Exception as e:
+            # Records of the wrong dtype or cut short
+            with self.lock:
+                self.metrics['load_errors'] += 1
+            self.maps[shard] = None
+            logger.error(f"Bad records in baseline shard {shard}: {e}")
+            return None
+
+    def score(self, entity, values, hour=None, location=None):
+        """Score against entity's baseline; None when it has none."""
+        baseline = self.get(entity)
+        if baseline is None:
+            return None
+        score, alerts = baseline.score(values, hour, location)
+        return {'entity': entity, 'score': score, 'alerts': alerts}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.metrics, cached=len(self.cache), max_entities=self.max_entities)
+
+def partition(data_path, work_dir, shards=SHARDS, chunk_rows=CHUNK_ROWS):
+    """Stream the data into per-shard spool files of raw arrays."""
+    import pandas as pd  # Only needed for building the registry
+    files = sorted(glob.glob(os.path.join(data_path, "*.csv"))) if os.path.isdir(data_path) else [data_path]
+    spools = {}
+    rows = 0
+    locations_seen = set()
+    longest_entity = 1
+    try:
+        for file in files:
+            columns = [ENTITY_COLUMN, 'timestamp', 'location'] + FEATURES
+            dtypes = dict({feature: np.float32 for feature in FEATURES}, **{ENTITY_COLUMN: str, 'location': str})
+            for chunk in pd.read_csv(file, usecols=columns, dtype=dtypes, chunksize=chunk_rows):
+                rows += len(chunk)
+                codes, entities = pd.factorize(chunk[ENTITY_COLUMN])
+                row_shards = np.array([shard_of(entity, shards) for entity in entities])[codes]
+                hours = pd.to_datetime(chunk['timestamp'], format="%Y-%m-%d %H:%M:%S").dt.hour.to_numpy(np.int8)
+                entity_ids = chunk[ENTITY_COLUMN].to_numpy().astype(str)
+                locations = chunk['location'].to_numpy().astype(str)
+                locations_seen.update(np.unique(locations).tolist())
+                longest_entity = max(longest_entity, max(len(entity) for entity in entities))
+                values = chunk[FEATURES].to_numpy(np.float32)
+                order = np.argsort(row_shards, kind='stable')
+                bounds = np.searchsorted(row_shards[order], np.arange(shards + 1))
+                for shard in range(shards):
+                    rows_in_shard = order[bounds[shard]:bounds[shard + 1]]
+                    if len(rows_in_shard) == 0:
+                        continue
+                    if shard not in spools:
+                        spools[shard] = open(os.path.join(work_dir, f"spool-{shard:03d}.bin"), 'wb')
+                    for array in (entity_ids, hours, locations, values):
+                        np.save(spools[shard], array[rows_in_shard])
+    finally:
+        for spool in spools.values():
+            spool.close()
+    return rows, sorted(locations_seen), longest_entity
+
+def record_dtype(location_count, longest_entity):
+    return np.dtype([
+        ('entity', f'U{longest_entity}'),
+        ('samples', np.int32),
+        ('quantiles', np.float32, (len(FEATURES), len(QUANTILES))),
+        ('hour_mask', np.bool_, (24,)),
+        ('location_mask', np.bool_, (location_count,))
+    ])
+
+def build_shard(spool_path, out_path, location_names, longest_entity):
+    """Summarize one spooled shard into per-entity baselines."""
+    parts = {'entities': [], 'hours': [], 'locations': [], 'values': []}
+    with open(spool_path, 'rb') as f:
+        while f.tell() < os.fstat(f.fileno()).st_size:
+            for key in parts:
+                parts[key].append(np.load(f))
+    entities = np.concatenate(parts['entities'])
+    hours = np.concatenate(parts['hours'])
+    locations = np.concatenate(parts['locations'])
+    values = np.concatenate(parts['values'])
+
+    names, inverse = np.unique(entities, return_inverse=True)  # Sorted, for searchsorted lookups
+    counts = np.bincount(inverse, minlength=len(names))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    records = np.zeros(len(names), dtype=record_dtype(len(location_names), longest_entity))
+    records['entity'] = names
+    records['samples'] = counts
+    for i in range(len(FEATURES)):
+        # Sort by (entity, value) once, then read each quantile by position
+        ordered = values[np.lexsort((values[:, i], inverse)), i]
+        for j, q in enumerate(QUANTILES):
+            records['quantiles'][:, i, j] = ordered[starts + np.floor(q * (counts - 1)).astype(np.int64)]
+    records['hour_mask'][inverse, hours] = True
+    records['location_mask'][inverse, np.searchsorted(location_names, locations)] = True
+    np.save(out_path, records)
+    return len(names)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build per-entity baselines from generated data")
+    parser.add_argument('data', help="CSV file or directory of CSV parts")
+    parser.add_argument('--out', default=BASELINE_DIR)
+    parser.add_argument('--shards', type=int, default=SHARDS)
+    args = parser.parse_args()
+
+    work_dir = os.path.join(args.out, "spool")
+    os.makedirs(work_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(args.out, "shard-*.npy")):
+        os.remove(stale)
+    print(f"Partitioning {args.data} into {args.shards} shards...")
+    rows, locations, longest_entity = partition(args.data, work_dir, args.shards)
+    entities = 0
+    for spool in sorted(glob.glob(os.path.join(work_dir, "spool-*.bin"))):
+        shard = os.path.basename(spool)[len("spool-"):-len(".bin")]
+        entities += build_shard(spool, os.path.join(args.out, f"shard-{shard}.npy"), np.array(locations), longest_entity)
+        os.remove(spool)
+    os.rmdir(work_dir)
+    with open(os.path.join(args.out, "index.json"), "w") as f:
+        json.dump({
+            'shards': args.shards,
+            'entity_column': ENTITY_COLUMN,
+            'features': FEATURES,
+            'quantiles': list(QUANTILES),
+            'locations': locations,
+            'entities': entities,
+            'rows': rows,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }, f, indent=2)
+    print(f"Built baselines for {entities:,} entities from {rows:,} rows in {args.out}/")
@@ -0,0 +1,69 @@
+import statistics
+import subprocess
+import time
+import psutil
+import proc_scanner
+
+# Configuration
+MIN_PROCESSES = 1000  # Idle sleepers are started until at least this many processes exist
+REPEATS = 20  # Timings are the median of this many runs
+
+def median_seconds(function, repeats=REPEATS):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def psutil_new_processes():
+    """What the agent did for every new PID: a Process, then name() and exe()."""
+    for pid in psutil.pids():
+        try:
+            p = psutil.Process(pid)
+            p.name(), p.exe()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+def psutil_tick():
+    """The agent's steady-state work per tick: the sampler's and the poll backend's PID lists and net totals."""
+    psutil.pids()
+    psutil.pids()
+    psutil.net_io_counters()
+
+def report(label, seconds, processes):
+    print(f"{label:<40} {seconds * 1000:8.2f} ms/scan  {seconds * 1000 / processes * 1000:8.2f} ms per 1,000 processes")
+
+if __name__ == "__main__":
+    if not proc_scanner.available():
+        raise SystemExit("No /proc here; the scanner only runs on Linux")
+    sleepers = [subprocess.Popen(['sleep', '3600']) for _ in range(max(MIN_PROCESSES - len(psutil.pids()), 0))]
+    try:
+        processes = len(psutil.pids())
+        print(f"Scanning {processes} processes, median of {REPEATS} runs")
+
+        # Every process new, as on the first scan or in a fork storm
+        report("psutil Process().name() + exe()", median_seconds(psutil_new_processes), processes)
+        report("scan, all new (exe resolved)", median_seconds(lambda: proc_scanner.ProcScanner().scan()), processes)
+
+        # Steady state: nothing new, counters only
+        report("psutil pids() x2 + net_io_counters()", median_seconds(psutil_tick), processes)
+        scanner = proc_scanner.ProcScanner(io=False)
+        scanner.scan()
+        report("scan, known processes", median_seconds(scanner.scan), processes)
+        scanner = proc_scanner.ProcScanner(io=True)
+        scanner.scan()
+        report("scan, known processes with IO counters", median_seconds(scanner.scan), processes)
+
+        # The scan also yields per-process IO rates and network deltas
+        previous = scanner.scan()
+        time.sleep(1)
+        current = scanner.scan()
+        rows, reads, writes = proc_scanner.process_io_rates(previous, current)
+        received, sent = proc_scanner.network_deltas(previous.network, current.network)
+        print(f"IO counters readable for {len(rows)}/{len(current)} processes; "
+              f"network over {current.time - previous.time:.2f}s: {received} B received, {sent} B sent")
+    finally:
+        for p in sleepers:
+            p.kill()
+            p.wait()
@@ -0,0 +1,76 @@
+import multiprocessing
+import resource
+import subprocess
+import time
+import Agent
+
+# Configuration
+BACKENDS = ["poll", "netlink"]
+STORM_SIZE = 500  # Short-lived processes spawned per run
+IDLE_SECONDS = 5
+DRAIN_SECONDS = 2
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def run_watcher(backend, conn):
+    """Child process: run one backend and report the PIDs it saw and its CPU use."""
+    seen = set()
+    try:
+        watcher = Agent.create_process_watcher(lambda pid, info=None: seen.add(pid), backend=backend)
+    except OSError as e:
+        conn.send(('error', str(e)))
+        return
+    Agent.threading.Thread(target=watcher.run, daemon=True).start()
+    conn.send(('ready', None))
+    while True:
+        command = conn.recv()
+        if command == 'cpu':
+            conn.send(cpu_seconds())
+        elif command == 'stop':
+            conn.send(seen)
+            return
+
+def benchmark(backend):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=run_watcher, args=(backend, child), daemon=True)
+    process.start()
+    status, error = parent.recv()
+    if status == 'error':
+        print(f"{backend:<8} unavailable: {error}")
+        process.join()
+        return
+    time.sleep(1)  # Let the poll backend take its initial PID snapshot
+
+    parent.send('cpu')
+    idle_start = parent.recv()
+    time.sleep(IDLE_SECONDS)
+    parent.send('cpu')
+    storm_start = parent.recv()
+
+    storm_pids = set()
+    start = time.perf_counter()
+    for _ in range(STORM_SIZE):
+        p = subprocess.Popen(['true'])
+        storm_pids.add(p.pid)
+        p.wait()
+    storm_seconds = time.perf_counter() - start
+    time.sleep(DRAIN_SECONDS)
+
+    parent.send('cpu')
+    storm_end = parent.recv()
+    parent.send('stop')
+    seen = parent.recv()
+    process.join()
+
+    caught = len(storm_pids & seen)
+    idle_cpu = (storm_start - idle_start) / IDLE_SECONDS * 100
+    storm_cpu = (storm_end - storm_start) * 1000
+    print(f"{backend:<8} caught {caught:>5}/{STORM_SIZE} ({caught / STORM_SIZE * 100:5.1f}%)  "
+          f"idle CPU {idle_cpu:5.2f}%  storm CPU {storm_cpu:7.1f} ms  (storm took {storm_seconds:.2f}s)")
+
+if __name__ == "__main__":
+    print(f"Fork storm of {STORM_SIZE} short-lived processes per backend")
+    for backend in BACKENDS:
+        benchmark(backend)
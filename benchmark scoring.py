@@ -0,0 +1,57 @@
+import time
+from datetime import datetime
+import numpy as np
+import Agent
+
+# Configuration
+DATA_FILE = "employee_behavior_data.csv"
+NUM_EVENTS = 2000  # The legacy path scores ~60 events/s, keep this modest
+BATCH_SIZES = [1, 16, 64, 256, 1024]
+
+# Load feature vectors, timestamps and locations from the synthetic data
+print("Loading synthetic data...")
+rows = np.genfromtxt(DATA_FILE, delimiter=',', skip_header=1, dtype=None, encoding='utf-8', max_rows=NUM_EVENTS)
+features = np.array([[row[i] for i in range(3, 10)] for row in rows], dtype=np.float64)
+timestamps = [datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S") for row in rows]
+locations = [row[2] for row in rows]
+n = len(features)
+
+def legacy_detect(vector, timestamp, location):
+    """The previous detect_anomaly: separate predict() and decision_function() passes."""
+    X = np.array(vector).reshape(1, -1)
+    prediction = Agent.model.predict(X)
+    score = -Agent.model.decision_function(X)[0]
+    anomaly_score = min(max((score + 1) / 2, 0), 1)
+    alerts = ["Suspicious activity"] if prediction[0] == -1 else []
+    if timestamp.hour not in Agent.NORMAL_HOURS:
+        anomaly_score = max(anomaly_score, 0.5)
+        alerts.append("Usage outside 9 AM–5 PM")
+    if location != Agent.NORMAL_LOCATION:
+        anomaly_score = max(anomaly_score, 0.5)
+        alerts.append(f"Usage outside {Agent.NORMAL_LOCATION}")
+    return anomaly_score, alerts
+
+def report(name, seconds):
+    print(f"{name:<24} {n / seconds:>12,.0f} events/s {seconds * 1e6 / n:>10.1f} us/event")
+
+print(f"Scoring {n} events...")
+start = time.perf_counter()
+legacy = [legacy_detect(features[i], timestamps[i], locations[i]) for i in range(n)]
+report("per-event (legacy)", time.perf_counter() - start)
+
+over_limit = np.zeros(n, dtype=bool)
+for batch_size in BATCH_SIZES:
+    start = time.perf_counter()
+    scores, alerts = [], []
+    for i in range(0, n, batch_size):
+        batch_scores, batch_alerts = Agent.score_batch(features[i:i + batch_size], timestamps[i:i + batch_size],
+                                                       locations[i:i + batch_size], over_limit[i:i + batch_size])
+        scores.append(batch_scores)
+        alerts.extend(batch_alerts)
+    report(f"batched (size {batch_size})", time.perf_counter() - start)
+
+# Batched scoring must match the per-event results
+scores = np.concatenate(scores)
+max_diff = np.max(np.abs(scores - np.array([score for score, _ in legacy])))
+print(f"Max score difference vs per-event: {max_diff:.2e}")
+print(f"Alerts match per-event: {alerts == [event_alerts for _, event_alerts in legacy]}")
@@ -0,0 +1,95 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from wire_format import encode_update, decode_update
+
+# Configuration
+LOGS_PER_UPDATE = [0, 5, 50, 500]  # Idle agent up to a full MAX_BATCH_LOGS batch
+REPEATS = 2000  # Updates encoded per measurement (fewer for big batches)
+
+random.seed(0)
+PROCESSES = ["chrome", "python3", "sshd", "bash", "code", "systemd-journal", "curl", "git"]
+FILES = ["/home/ali/Documents/report.docx", "/home/ali/.cache/pip/http/a1/b2", "/home/ali/project/Agent.py",
+         "/home/ali/Downloads/setup.exe", "/home/ali/.bash_history"]
+
+def make_log(seq, timestamp):
+    kind = random.random()
+    if kind < 0.6:
+        activity = "Process Started"
+        details = f"Process started: {random.choice(PROCESSES)} (PID: {random.randint(1000, 99999)})"
+    elif kind < 0.9:
+        activity = "File Modified"
+        details = f"File: {random.choice(FILES)} ({random.randint(1, 20)} events, {random.randint(0, 10 ** 6)} bytes)"
+    else:
+        activity = "System Metrics Anomaly"
+        details = f"Metrics: CPU={random.uniform(0, 100):.1f}%, Memory={random.uniform(0, 100):.1f}%, Disk=61.2%, Location=Bahawalpur"
+    score = random.random() ** 4
+    alerts = ["Suspicious activity"] if score > 0.5 else []
+    if timestamp.hour not in range(9, 17):
+        alerts.append("Usage outside 9 AM–5 PM")
+    return {
+        'seq': seq,
+        'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        'activity': activity,
+        'details': details,
+        'anomaly_score': score,
+        'alerts': alerts
+    }
+
+def make_update(num_logs):
+    """An update shaped like Agent.send_update builds it."""
+    start = datetime(2024, 5, 6, 16, 59, 50)
+    logs = [make_log(1000 + i, start + timedelta(seconds=i // 10)) for i in range(num_logs)]
+    metrics = {'cpu': 23.4, 'memory_percent': 61.8, 'disk_percent': 47.0,
+               'network_sent': 153.2743, 'network_received': 882.1095}  # MB per hour
+    return {
+        'agent_id': "agent_001",
+        'session_id': "5f2a9c4e0b7d4e1f8a3c6b9d2e4f7a10",
+        'system_name': "DESKTOP-7Q2KD4M",
+        'version': "1.0.0",
+        'current_user': "ali",
+        'status': 'active',
+        'performance': metrics,
+        'cpu_trend': [metrics['cpu']] * 5,
+        'network_traffic': {'daily_usage': 10353.8383},  # MB today
+        'analysis': {
+            'suspicious_patterns': [log['activity'] for log in logs if log['anomaly_score'] > 0.3],
+            'risk_score': sum(log['anomaly_score'] for log in logs) * 10
+        },
+        'logs': logs,
+        'buffer': {'buffered': num_logs, 'spill_bytes': 0, 'spilled': 0, 'dropped': 0},
+        'file_events': {'received': 812, 'filtered': 301, 'coalesced': 420, 'overflow_dropped': 0,
+                        'rate_dropped': 0, 'emitted': 91, 'pending': 3},
+        'process_io': [{'pid': 4312 + i, 'name': name, 'read_bytes_per_second': 1048576.0 / (i + 1),
+                        'write_bytes_per_second': 65536.0 * i} for i, name in enumerate(
+                            ["chrome", "OneDrive", "MsMpEng", "Teams", "svchost"])]
+    }
+
+def timed(func, arg, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func(arg)
+    return (time.perf_counter() - start) * 1e6 / repeats, result
+
+# Socket.IO sends dict payloads as JSON text, so json.dumps/loads is the baseline
+print(f"{'logs':>5} {'json bytes':>11} {'packed bytes':>13} {'ratio':>6} "
+      f"{'json enc us':>12} {'packed enc us':>14} {'json dec us':>12} {'packed dec us':>14}")
+for num_logs in LOGS_PER_UPDATE:
+    update = make_update(num_logs)
+    repeats = max(REPEATS // max(num_logs // 10, 1), 20)
+    json_encode_us, text = timed(json.dumps, update, repeats)
+    packed_encode_us, payload = timed(encode_update, update, repeats)
+    json_decode_us, _ = timed(json.loads, text, repeats)
+    packed_decode_us, decoded = timed(decode_update, payload, repeats)
+    json_bytes = len(text.encode('utf-8'))
+    print(f"{num_logs:>5} {json_bytes:>11,} {len(payload):>13,} {json_bytes / len(payload):>5.1f}x "
+          f"{json_encode_us:>12.1f} {packed_encode_us:>14.1f} {json_decode_us:>12.1f} {packed_decode_us:>14.1f}")
+
+    # The packed round trip must give the server the same logs and metrics
+    for original, restored in zip(update['logs'], decoded['logs']):
+        assert abs(original['anomaly_score'] - restored['anomaly_score']) < 1e-6  # Sent as float32
+        assert dict(original, anomaly_score=0) == dict(restored, anomaly_score=0)
+    assert decoded['performance']['network_sent'] == update['performance']['network_sent']
+    assert decoded['buffer'] == update['buffer'] and decoded['file_events'] == update['file_events']
+print("Round trip check passed")
@@ -0,0 +1,58 @@
+import os
+import shutil
+import numpy as np
+
+# Pure-NumPy IsolationForest scorer over the trees exported by "train model.py",
+# used by the agent and by the server's scoring service.
+
+class FlatForest:
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.left = data['left']
+            self.right = data['right']
+            self.feature = data['feature']
+            self.threshold = data['threshold']
+            self.value = data['value']
+            self.roots = data['roots']
+            self.max_depth = int(data['max_depth'])
+            self.denominator = float(data['denominator'])
+            self.offset_ = float(data['offset'])
+            self.n_features_in_ = int(data['n_features'])
+            # Exports from before versioned artifacts have no version
+            self.version = str(data['version']) if 'version' in data.files and str(data['version']) else None
+
+    def score_samples(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features_in_)
+        rows = np.arange(len(X))[:, None]
+        # Walk every tree at once; leaves point to themselves
+        nodes = np.tile(self.roots, (len(X), 1))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        # cumsum adds tree by tree, matching sklearn's summation order exactly
+        depths = np.cumsum(self.value[nodes], axis=1)[:, -1]
+        return -(2 ** -(depths / self.denominator))
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    def anomaly_scores(self, X):
+        """Anomaly scores in [0, 1] and whether each row is an outlier, from one tree pass."""
+        # predict() is just decision_function() < 0, so one tree pass gives both
+        decision = self.decision_function(X)
+        return np.clip((1 - decision) / 2, 0, 1), decision < 0
+
+def install_model(source, path):
+    """Copy a model export over path atomically, so a reader polling path never loads part of a file."""
+    temporary = f"{path}.{os.getpid()}.tmp"  # Same directory, so the rename can't cross filesystems
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
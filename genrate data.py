@@ -1,23 +1,29 @@
+import argparse
+import math
+import os
+import time
+from multiprocessing import Pool
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import random
-
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
 
 # Configuration
 NUM_EMPLOYEES = 2000
 SAMPLES_PER_EMPLOYEE = 24
-TOTAL_SAMPLES = NUM_EMPLOYEES * SAMPLES_PER_EMPLOYEE
-ANOMALY_RATIO = 0.1  # 10% anomalous
-OUTPUT_FILE = "employee_behavior_data.csv"
+ANOMALY_RATIO = 0.1  # 10% of employees behave anomalously
+SEED = 42
+OUTPUT_FILE = "employee_behavior_data.csv"  # Used when everything fits in one shard
+OUTPUT_DIR = "employee_behavior_data"  # part-NNNNN files when there are several shards
+SHARD_EMPLOYEES = 50000  # Employees per shard; a shard is one output part and one task
+BLOCK_EMPLOYEES = 5000  # Employees generated and written at a time within a shard
 NORMAL_HOURS = range(9, 17)  # 9:00 AM to 5:00 PM
 NORMAL_LOCATION = "Bahawalpur"
 OTHER_LOCATIONS = ["Lahore", "Karachi", "Islamabad", "Faisalabad", "Rawalpindi"]
 DAILY_DATA_LIMIT_MB = 10240  # 10 GB
-BASE_DATE = datetime(2025, 5, 15)  # Base date for timestamps
+BASE_DATE = np.datetime64("2025-05-15T00:00:00")  # Base date for timestamps
+
+COLUMNS = ['employee_id', 'timestamp', 'location', 'cpu', 'memory_percent',
+           'disk_percent', 'network_sent', 'network_received', 'process_count', 'is_suspicious', 'is_anomaly']
+NUMERIC_FEATURES = ['cpu', 'memory_percent', 'disk_percent', 'network_sent', 'network_received', 'process_count']
 
 # Normal behavior distributions
 normal_dist = {
@@ -41,88 +47,140 @@ anomaly_dist = {
     'is_suspicious': {'prob': 0.5}
 }
 
-def generate_timestamp(is_anomaly):
-    """Generate a timestamp (normal: 9 AM–5 PM, anomalous: outside)."""
-    if is_anomaly:
-        # Outside 9 AM–5 PM (e.g., 12 AM–9 AM or 5 PM–12 AM)
-        hour = random.choice([h for h in range(24) if h not in NORMAL_HOURS])
-    else:
-        hour = random.choice(NORMAL_HOURS)
-    minute = random.randint(0, 59)
-    second = random.randint(0, 59)
-    return BASE_DATE.replace(hour=hour, minute=minute, second=second)
-
-def generate_sample(is_anomaly, daily_data_used):
-    """Generate a single sample based on normal or anomalous distributions."""
-    dist = anomaly_dist if is_anomaly else normal_dist
-    sample = {}
-    
-    # Generate metrics
-    for feature, params in dist.items():
-        if feature == 'is_suspicious':
-            sample[feature] = 1 if random.random() < params['prob'] else 0
+def generate_block(rng, first_employee, num_employees, samples, id_width):
+    """Generate every sample for a block of employees as one DataFrame.
+
+    Each feature is drawn for the whole block at once as an
+    (employees, samples) array, with per-employee mean/std/limits picked
+    by whether the employee is anomalous.
+    """
+    shape = (num_employees, samples)
+    is_anomaly = rng.random(num_employees) < ANOMALY_RATIO  # Decided per employee
+    anomalous = is_anomaly[:, None]
+    columns = {}
+    for feature in NUMERIC_FEATURES:
+        normal, anomaly = normal_dist[feature], anomaly_dist[feature]
+        values = rng.normal(np.where(anomalous, anomaly['mean'], normal['mean']),
+                            np.where(anomalous, anomaly['std'], normal['std']), shape)
+        values = np.clip(values, np.where(anomalous, anomaly['min'], normal['min']),
+                         np.where(anomalous, anomaly['max'], normal['max']))
+        columns[feature] = np.round(values, 2)
+    prob = np.where(anomalous, anomaly_dist['is_suspicious']['prob'], normal_dist['is_suspicious']['prob'])
+    columns['is_suspicious'] = (rng.random(shape) < prob).astype(np.int8)
+
+    # Keep each normal employee within the daily data limit. Usage builds up
+    # sample by sample, so walk the sample axis with the employees vectorized.
+    sent, received = columns['network_sent'], columns['network_received']
+    used = np.zeros(num_employees)
+    for j in range(samples):
+        max_allowed = np.floor((DAILY_DATA_LIMIT_MB - used) / (samples * 0.5) * 100) / 100  # Conservative, 2 dp
+        sent[:, j] = np.where(is_anomaly, sent[:, j], np.minimum(sent[:, j], max_allowed))
+        received[:, j] = np.where(is_anomaly, received[:, j], np.minimum(received[:, j], max_allowed))
+        used += sent[:, j] + received[:, j]
+
+    # Timestamps: normal inside 9 AM–5 PM, anomalous outside
+    normal_hours = np.array(NORMAL_HOURS)
+    other_hours = np.array([h for h in range(24) if h not in NORMAL_HOURS])
+    hours = np.where(anomalous, other_hours[rng.integers(0, len(other_hours), shape)],
+                     normal_hours[rng.integers(0, len(normal_hours), shape)])
+    seconds = hours * 3600 + rng.integers(0, 3600, shape)
+    columns['timestamp'] = BASE_DATE + seconds.astype('timedelta64[s]')
+
+    locations = np.array([NORMAL_LOCATION] + OTHER_LOCATIONS)
+    columns['location'] = np.where(anomalous, locations[rng.integers(1, len(locations), shape)], locations[0])
+    ids = np.char.add("emp_", np.char.zfill(np.arange(first_employee + 1, first_employee + num_employees + 1).astype(str), id_width))
+    columns['employee_id'] = np.repeat(ids, samples).reshape(shape)
+    columns['is_anomaly'] = np.repeat(is_anomaly.astype(np.int8), samples).reshape(shape)  # Ground truth for evaluation
+
+    order = rng.permutation(num_employees * samples)  # Shuffle rows within the block
+    df = pd.DataFrame({name: columns[name].reshape(-1)[order] for name in COLUMNS})
+    stats = {
+        'rows': len(df),
+        'anomalous_employees': int(is_anomaly.sum()),
+        'employees_over_limit': int((used > DAILY_DATA_LIMIT_MB).sum()),
+        'normal_employees_over_limit': int((used[~is_anomaly] > DAILY_DATA_LIMIT_MB).sum())
+    }
+    return df, stats
+
+class PartWriter:
+    """Appends DataFrames to one CSV or Parquet file."""
+
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.writer = None
+
+    def write(self, df):
+        if self.file_format == 'parquet':
+            import pyarrow as pa  # Only needed for Parquet output
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)  # One row group per block
         else:
-            value = np.random.normal(params['mean'], params['std'])
-            value = max(params['min'], min(params['max'], value))
-            sample[feature] = round(value, 2)
-    
-    # Timestamp
-    sample['timestamp'] = generate_timestamp(is_anomaly).strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Location
-    sample['location'] = random.choice(OTHER_LOCATIONS) if is_anomaly else NORMAL_LOCATION
-    
-    # Adjust network usage to respect daily data limit
-    if not is_anomaly:
-        # Ensure total daily usage doesn't exceed 10 GB
-        max_allowed = (DAILY_DATA_LIMIT_MB - daily_data_used) / (SAMPLES_PER_EMPLOYEE * 0.5)  # Conservative
-        sample['network_sent'] = min(sample['network_sent'], max_allowed)
-        sample['network_received'] = min(sample['network_received'], max_allowed)
-    
-    return sample
-
-# Generate synthetic data
-data = []
-num_anomalies = int(TOTAL_SAMPLES * ANOMALY_RATIO)
-num_normal = TOTAL_SAMPLES - num_anomalies
-
-# Track daily data usage per employee
-daily_data_usage = {f"emp_{i+1:04d}": 0 for i in range(NUM_EMPLOYEES)}
-employee_samples = {eid: [] for eid in daily_data_usage}
-
-# Generate samples per employee
-for emp_idx in range(NUM_EMPLOYEES):
-    emp_id = f"emp_{emp_idx+1:04d}"
-    is_anomaly = random.random() < ANOMALY_RATIO  # Decide if employee has anomalous behavior
-    for _ in range(SAMPLES_PER_EMPLOYEE):
-        sample = generate_sample(is_anomaly, daily_data_usage[emp_id])
-        employee_samples[emp_id].append(sample)
-        daily_data_usage[emp_id] += sample['network_sent'] + sample['network_received']
-
-# Flatten samples and shuffle
-for emp_id, samples in employee_samples.items():
-    for sample in samples:
-        sample['employee_id'] = emp_id
-        data.append(sample)
-random.shuffle(data)
-
-# Create DataFrame
-df = pd.DataFrame(data)
-
-# Reorder columns
-columns = ['employee_id', 'timestamp', 'location', 'cpu', 'memory_percent', 
-           'disk_percent', 'network_sent', 'network_received', 'process_count', 'is_suspicious']
-df = df[columns]
-
-# Save to CSV
-df.to_csv(OUTPUT_FILE, index=False)
-print(f"Synthetic data saved to {OUTPUT_FILE}")
-print(f"Total samples: {len(df)}")
-print(f"Normal samples (approx): {num_normal}")
-print(f"Anomalous samples (approx): {num_anomalies}")
-
-# Validate daily data usage
-daily_usage = df.groupby('employee_id')[['network_sent', 'network_received']].sum()
-daily_usage['total_mb'] = daily_usage['network_sent'] + daily_usage['network_received']
-anomalous_usage = daily_usage[daily_usage['total_mb'] > DAILY_DATA_LIMIT_MB]
-print(f"Employees exceeding 10 GB: {len(anomalous_usage)}")
\ No newline at end of file
+            if self.writer is None:
+                self.writer = open(self.path, 'w', newline='')
+                df.to_csv(self.writer, index=False, date_format="%Y-%m-%d %H:%M:%S")
+            else:
+                df.to_csv(self.writer, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S")
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def generate_shard(task):
+    """Generate one shard block by block; returns its totals.
+
+    The generator is seeded from (seed, shard), so a shard comes out the
+    same whatever the number of workers.
+    """
+    shard, path, file_format, seed, num_employees, samples = task
+    rng = np.random.default_rng([seed, shard])
+    id_width = max(4, len(str(num_employees)))
+    first = shard * SHARD_EMPLOYEES
+    last = min(first + SHARD_EMPLOYEES, num_employees)
+    totals = {}
+    writer = PartWriter(path, file_format)
+    try:
+        for start in range(first, last, BLOCK_EMPLOYEES):
+            df, stats = generate_block(rng, start, min(BLOCK_EMPLOYEES, last - start), samples, id_width)
+            writer.write(df)
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+    finally:
+        writer.close()
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic employee behavior data")
+    parser.add_argument('--employees', type=int, default=NUM_EMPLOYEES)
+    parser.add_argument('--samples', type=int, default=SAMPLES_PER_EMPLOYEE, help="Samples per employee")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    num_shards = math.ceil(args.employees / SHARD_EMPLOYEES)
+    extension = 'parquet' if args.format == 'parquet' else 'csv'
+    if num_shards == 1:
+        paths = [os.path.splitext(OUTPUT_FILE)[0] + '.' + extension]
+    else:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        paths = [os.path.join(OUTPUT_DIR, f"part-{shard:05d}.{extension}") for shard in range(num_shards)]
+    tasks = [(shard, paths[shard], args.format, args.seed, args.employees, args.samples) for shard in range(num_shards)]
+
+    start = time.perf_counter()
+    totals = {}
+    workers = max(1, min(args.workers, num_shards))
+    with Pool(workers) as pool:
+        for shard_totals in pool.imap_unordered(generate_shard, tasks):
+            for key, value in shard_totals.items():
+                totals[key] = totals.get(key, 0) + value
+    elapsed = time.perf_counter() - start
+
+    print(f"Synthetic data saved to {paths[0] if num_shards == 1 else OUTPUT_DIR + '/'} ({num_shards} shard(s), {workers} worker(s))")
+    print(f"Total samples: {totals['rows']:,} in {elapsed:.1f}s ({totals['rows'] / elapsed:,.0f} rows/s)")
+    print(f"Anomalous employees: {totals['anomalous_employees']:,} of {args.employees:,}")
+    print(f"Employees exceeding 10 GB: {totals['employees_over_limit']:,} "
+          f"(normal employees: {totals['normal_employees_over_limit']})")
@@ -0,0 +1,263 @@
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight metrics shared by Agent.py and Server.py: counters, latency
+# histograms, a one-line periodic summary, Prometheus-style text for a local
+# /metrics endpoint, rate-limited logging and an opt-in sampling profiler.
+
+# Upper bounds in seconds of the latency buckets (the last one is +Inf)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005  # Seconds between profiler samples
+PROFILE_MAX_STACKS = 5000  # Distinct stacks kept; rarer ones are counted as dropped
+
+class Histogram:
+    __slots__ = ('lock', 'counts', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.total += seconds
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.total, self.count, self.max
+
+    @staticmethod
+    def quantile(counts, count, q):
+        """Upper bound of the bucket holding the q-th observation."""
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+class Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Metrics:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = collections.defaultdict(int)
+        self.histograms = {}
+        self.last_summary = {}
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name):
+        """Context manager recording the block's duration under name."""
+        return Timer(self.histogram(name))
+
+    def timed(self, name):
+        """Decorator form of timer()."""
+        def decorate(func):
+            histogram = self.histogram(name)
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with Timer(histogram):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def render(self):
+        """Prometheus text exposition of every counter and histogram."""
+        lines = []
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {self.prefix}_{name}_total counter")
+            lines.append(f"{self.prefix}_{name}_total {value}")
+        for name, histogram in sorted(histograms.items()):
+            counts, total, count, _ = histogram.snapshot()
+            metric = f"{self.prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum {total:.6f}")
+            lines.append(f"{metric}_count {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One line covering what happened since the previous summary."""
+        parts = []
+        with self.lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        for name, histogram in sorted(histograms.items()):
+            counts, total, count, peak = histogram.snapshot()
+            previous_counts, previous_count = self.last_summary.get(name, ([0] * len(counts), 0))
+            self.last_summary[name] = (counts, count)
+            delta = [a - b for a, b in zip(counts, previous_counts)]
+            n = count - previous_count
+            if n:
+                p50 = Histogram.quantile(delta, n, 0.5) * 1000
+                p99 = Histogram.quantile(delta, n, 0.99) * 1000
+                parts.append(f"{name} n={n} p50<={p50:g}ms p99<={p99:g}ms")
+        for name, value in sorted(counters.items()):
+            previous = self.last_summary.get(name, 0)
+            self.last_summary[name] = value
+            if value != previous:
+                parts.append(f"{name}+{value - previous}")
+        return " | ".join(parts) if parts else "idle"
+
+    def start_summary(self, logger, interval, sleep=time.sleep, spawn=None):
+        """Log summary() every interval seconds from a background thread or task."""
+        def run():
+            while True:
+                sleep(interval)
+                logger.info(f"metrics: {self.summary()}")
+        if spawn:
+            spawn(run)
+        else:
+            threading.Thread(target=run, daemon=True).start()
+
+# Logs at most once per interval for each key, noting how many were skipped
+class RateLimitedLog:
+    def __init__(self, logger, interval=10.0):
+        self.logger = logger
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}  # key -> (time last logged, messages suppressed since)
+
+    def log(self, level, key, message):
+        now = time.monotonic()
+        with self.lock:
+            logged_at, suppressed = self.last.get(key, (float('-inf'), 0))
+            if now - logged_at < self.interval:
+                self.last[key] = (logged_at, suppressed + 1)
+                return
+            self.last[key] = (now, 0)
+        if suppressed:
+            message = f"{message} (+{suppressed} similar in the last {self.interval:g}s)"
+        self.logger.log(level, message)
+
+    def info(self, key, message):
+        self.log(20, key, message)
+
+    def warning(self, key, message):
+        self.log(30, key, message)
+
+# Samples every thread's stack on a timer and counts collapsed stacks
+# ("outer;inner;leaf count" lines, the input flamegraph.pl and speedscope take).
+# Off unless started; THREXEL_PROFILE=1 starts it in Agent.py and Server.py.
+# sys._current_frames() only sees OS threads: under gevent every greenlet
+# shares the hub's thread, so samples would show the hub and nothing of the
+# handlers. start() refuses when gevent has patched threading.
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, max_stacks=PROFILE_MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.thread = None
+
+    @staticmethod
+    def enabled():
+        return os.environ.get('THREXEL_PROFILE') == '1'
+
+    @staticmethod
+    def supported():
+        """False once gevent has monkey-patched threading."""
+        monkey = sys.modules.get('gevent.monkey')
+        return monkey is None or not monkey.is_module_patched('threading')
+
+    def start(self):
+        if not self.supported():
+            raise RuntimeError("SamplingProfiler cannot sample greenlets; run without gevent to profile")
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                with self.lock:
+                    self.samples += 1
+                    if key in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[key] += 1
+                    else:
+                        self.dropped += 1
+
+    def collapsed(self):
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def serve_metrics(metrics, port, profiler=None, host='127.0.0.1'):
+    """Serve /metrics (and /profile when profiling) on a local port."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = metrics.render()
+            elif self.path == '/profile' and profiler is not None:
+                body = profiler.collapsed()
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass  # Scrapes would otherwise log a line each
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+import json
+from pymongo import MongoClient, UpdateOne
+
+# Configuration
+MONGO_URI = "mongodb://localhost:27017/"
+DATABASE = "agent_logs"
+COLLECTION = "logs"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Local time, stored as UTC like Server.py does
+BATCH_SIZE = 1000
+
+# Convert logs written before timestamps were stored as dates and alerts as
+# arrays. Safe to re-run: already migrated documents are skipped.
+client = MongoClient(MONGO_URI)
+logs_collection = client[DATABASE][COLLECTION]
+# $type also matches arrays containing strings, so exclude migrated alert arrays
+legacy = {'$or': [{'timestamp': {'$type': 'string'}}, {'alerts': {'$type': 'string', '$not': {'$type': 'array'}}}]}
+
+print(f"Legacy logs to migrate: {logs_collection.count_documents(legacy)}")
+migrated = 0
+skipped = 0
+last_id = None
+while True:
+    query = dict(legacy, _id={'$gt': last_id}) if last_id is not None else legacy
+    batch = list(logs_collection.find(query, {'timestamp': 1, 'alerts': 1}).sort('_id', 1).limit(BATCH_SIZE))
+    if not batch:
+        break
+    updates = []
+    for doc in batch:
+        changes = {}
+        if isinstance(doc.get('timestamp'), str):
+            try:
+                changes['timestamp'] = datetime.strptime(doc['timestamp'], TIMESTAMP_FORMAT).astimezone(timezone.utc)
+            except ValueError:
+                skipped += 1
+        if isinstance(doc.get('alerts'), str):
+            try:
+                changes['alerts'] = json.loads(doc['alerts'])
+            except ValueError:
+                changes['alerts'] = [doc['alerts']]
+        if changes:
+            updates.append(UpdateOne({'_id': doc['_id']}, {'$set': changes}))
+    if updates:
+        logs_collection.bulk_write(updates, ordered=False)
+    migrated += len(updates)
+    last_id = batch[-1]['_id']
+    print(f"Migrated {migrated} logs...")
+
+print(f"Migration complete: {migrated} logs updated, {skipped} unparseable timestamps left as strings")
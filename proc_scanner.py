@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import numpy as np
+
+# One-pass /proc reader behind the agent's process monitor and metrics
+# sampler on Linux (see available()). psutil builds a Process per PID and goes
+# back to /proc for every attribute asked for; a scan reads /proc/<pid>/stat
+# once per process, /proc/<pid>/io when IO is tracked and /proc/net/dev once,
+# into arrays. The exe link is only resolved the first time a process is seen.
+#
+# Processes are keyed by PID and start time, so a reused PID is a new process.
+# All counters are cumulative; rates come from the deltas between two
+# snapshots (see new_rows, process_io_rates and network_deltas).
+
+PROC = '/proc'
+PID_BITS = 22  # pid_max is at most 2^22 on Linux
+NAME_LENGTH = 15  # The kernel cuts comm to this many characters
+
+def available(proc=PROC):
+    return os.path.exists(os.path.join(proc, 'self', 'stat'))
+
+def read_file(path, size=4096):
+    """Read a /proc file with raw syscalls; stat and io fit in one read."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = [os.read(fd, size)]
+        while len(chunks[-1]) == size:
+            chunks.append(os.read(fd, size))
+        return b''.join(chunks)
+    finally:
+        os.close(fd)
+
+def parse_stat(data):
+    """(comm, ppid, start time in clock ticks) from /proc/<pid>/stat."""
+    # comm may hold spaces and parentheses, so split after the last ')'
+    head, _, rest = data.rpartition(b')')
+    fields = rest.split()
+    return head[head.index(b'(') + 1:].decode('utf-8', 'replace'), int(fields[1]), int(fields[19])
+
+def parse_io(data):
+    """(bytes read, bytes written) from /proc/<pid>/io.
+
+    These are rchar and wchar, which count sockets and pipes as well as
+    files, so a process sending data over the network shows up here.
+    """
+    fields = data.split()
+    return int(fields[1]), int(fields[3])
+
+def read_exe(proc, pid):
+    """Path of a process's executable; '' for kernel threads, None without permission."""
+    try:
+        return os.readlink(f'{proc}/{pid}/exe')
+    except PermissionError:
+        return None
+    except OSError:
+        return ''
+
+def process_name(comm, exe):
+    # Like psutil, use the executable's name when comm is a cut-off prefix of it
+    base = os.path.basename(exe or '')
+    return base if len(comm) >= NAME_LENGTH and base.startswith(comm) else comm
+
+def describe_process(pid, proc=PROC):
+    """(name, exe) of a running process read fresh from /proc; None once it has exited."""
+    try:
+        comm = parse_stat(read_file(f'{proc}/{pid}/stat'))[0]
+    except (OSError, ValueError, IndexError):
+        return None
+    exe = read_exe(proc, pid)
+    return process_name(comm, exe), exe
+
+def read_network(proc=PROC):
+    """{interface: (bytes received, bytes sent)} from /proc/net/dev, loopback excluded."""
+    counters = {}
+    for line in read_file(f'{proc}/net/dev', 65536).splitlines()[2:]:  # Two header lines
+        name, _, values = line.partition(b':')
+        name = name.strip().decode()
+        if name == 'lo':
+            continue
+        values = values.split()
+        counters[name] = (int(values[0]), int(values[8]))
+    return counters
+
+class ProcSnapshot:
+    __slots__ = ('time', 'pid', 'ppid', 'start', 'io_read', 'io_write', 'comm', 'exe', 'keys', 'network')
+
+    def __init__(self, time, pid, ppid, start, io_read, io_write, comm, exe, network):
+        self.time = time  # time.monotonic() when the scan finished
+        self.pid = np.array(pid, dtype=np.int64)
+        self.ppid = np.array(ppid, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)  # Clock ticks after boot
+        self.io_read = np.array(io_read, dtype=np.int64)  # -1 where the io file wasn't readable
+        self.io_write = np.array(io_write, dtype=np.int64)
+        self.comm = comm
+        self.exe = exe  # None where the exe link wasn't readable
+        self.keys = (self.start << PID_BITS) | self.pid
+        self.network = network  # {interface: (bytes received, bytes sent)}
+
+    def __len__(self):
+        return len(self.pid)
+
+    def describe(self, row):
+        """(name, exe) of the process in a row, as describe_process returns it."""
+        return process_name(self.comm[row], self.exe[row]), self.exe[row]
+
+class ProcScanner:
+    def __init__(self, io=True, proc=PROC):
+        self.lock = threading.Lock()
+        self.io = io
+        self.proc = proc
+        self.known = {}  # (pid, start) -> [exe, io readable], for processes in the latest scan
+        self.latest = None
+        self.stats = {'scans': 0, 'processes': 0, 'last_scan_ms': 0.0}
+
+    def scan(self):
+        """Read every process and the network counters into a new snapshot."""
+        with self.lock:
+            started = time.perf_counter()
+            pids, ppids, starts, io_reads, io_writes, comms, exes = [], [], [], [], [], [], []
+            known = {}
+            for name in os.listdir(self.proc):
+                if not name.isdigit():
+                    continue
+                try:
+                    comm, ppid, start = parse_stat(read_file(f'{self.proc}/{name}/stat'))
+                except (OSError, ValueError, IndexError):
+                    continue  # Exited since the listing
+                pid = int(name)
+                info = self.known.get((pid, start))
+                if info is None:
+                    info = [read_exe(self.proc, name), self.io]
+                known[(pid, start)] = info
+                io_read = io_write = -1
+                if info[1]:
+                    try:
+                        io_read, io_write = parse_io(read_file(f'{self.proc}/{name}/io'))
+                    except PermissionError:
+                        info[1] = False  # Another user's process; don't try again
+                    except (OSError, ValueError, IndexError):
+                        pass
+                pids.append(pid)
+                ppids.append(ppid)
+                starts.append(start)
+                io_reads.append(io_read)
+                io_writes.append(io_write)
+                comms.append(comm)
+                exes.append(info[0])
+            self.known = known
+            try:
+                network = read_network(self.proc)
+            except (OSError, ValueError, IndexError):
+                network = {}
+            snapshot = ProcSnapshot(time.monotonic(), pids, ppids, starts, io_reads, io_writes, comms, exes, network)
+            self.latest = snapshot
+            self.stats['scans'] += 1
+            self.stats['processes'] = len(snapshot)
+            self.stats['last_scan_ms'] = (time.perf_counter() - started) * 1000
+            return snapshot
+
+    def recent(self, max_age, after=None):
+        """The latest snapshot if it's under max_age seconds old and newer than after, else a new scan."""
+        snapshot = self.latest
+        if snapshot is None or time.monotonic() - snapshot.time >= max_age or (after is not None and snapshot.time <= after.time):
+            return self.scan()
+        return snapshot
+
+def new_rows(previous, current):
+    """Rows of current holding processes that weren't running in previous."""
+    if previous is None:
+        return np.arange(len(current))
+    return np.flatnonzero(~np.isin(current.keys, previous.keys, assume_unique=True))
+
+def process_io_rates(previous, current):
+    """(rows of current, bytes read per second, bytes written per second) for
+    processes in both snapshots whose IO counters could be read."""
+    _, now, before = np.intersect1d(current.keys, previous.keys, assume_unique=True, return_indices=True)
+    readable = (current.io_read[now] >= 0) & (previous.io_read[before] >= 0)
+    now, before = now[readable], before[readable]
+    elapsed = max(current.time - previous.time, 1e-9)
+    return (now, (current.io_read[now] - previous.io_read[before]) / elapsed,
+            (current.io_write[now] - previous.io_write[before]) / elapsed)
+
+def network_deltas(previous, current):
+    """Bytes (received, sent) between two {interface: (received, sent)} readings."""
+    received = sent = 0
+    for name, (rx, tx) in current.items():
+        previous_rx, previous_tx = previous.get(name, (0, 0))  # New interfaces count from zero
+        # A counter that went backwards was reset; count from zero again
+        received += rx - previous_rx if rx >= previous_rx else rx
+        sent += tx - previous_tx if tx >= previous_tx else tx
+    return received, sent
@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+import aiohttp
+import psutil
+import socketio  # AsyncClient needs aiohttp installed
+from traffic_recorder import TrafficRecorder, read_trace
+from wire_format import decode_update, encode_update
+
+# Replays agent traffic against a server and reports how it kept up.
+#
+# Traces come from a running server (THREXEL_RECORD=trace.jsonl.gz python Server.py)
+# or are synthesized from the generator's data, one agent per employee:
+#   python "replay traffic.py" synthesize employee_behavior_data.csv trace.jsonl.gz
+# Then play them back, here 60x faster with every agent cloned 10 times,
+# against a server started on a spare port with mongomock in place of MongoDB:
+#   python "replay traffic.py" replay trace.jsonl.gz --speed 60 --clones 10 --spawn --mongomock
+# Or load test with simulated agents sending random logs every interval:
+#   python "replay traffic.py" simulate --agents 1000 --duration 60 --spawn --mongomock --async-mode gevent
+#
+# Reported: log_update acks per second, ack latency, update-to-dashboard
+# latency (send until a logged-in dashboard receives the frame with the
+# update's newest log), how far the replay fell behind schedule, and the
+# server's RSS including its children. With mongomock, stored logs stay in
+# the server's memory and count toward its RSS.
+
+DASHBOARD_USER = 'admin'
+DASHBOARD_PASSWORD = 'password'
+SERVER_START_TIMEOUT = 30  # Seconds to wait for a spawned server to answer
+REPORT_INTERVAL = 5  # Seconds between progress lines
+ACTIVITIES = ["Process Started", "File Modified", "User Activity", "System Metrics Anomaly"]  # For simulated agents
+
+# Starts Server.py in a child process: argv is port, then "1" to use mongomock
+SERVER_BOOTSTRAP = """
+import sys
+if sys.argv[2] == '1':
+    import mongomock, pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+import Server
+Server.socketio.run(Server.app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True, log_output=False)
+"""
+
+stats = {
+    'connected': 0, 'updates': 0, 'logs': 0, 'unacked': 0, 'connect_errors': 0, 'errors': 0,
+    'ack_latencies': [], 'dashboard_latencies': [], 'frames': 0, 'lag': 0.0, 'rss': [], 'finished_agents': 0
+}
+pending = defaultdict(deque)  # agent_id -> (newest log, send time) of updates not yet on the dashboard
+
+def log_key(log):
+    return log['timestamp'], log['activity'], log['details']
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000 if values else 0.0
+
+# Synthesis from "genrate data.py" output
+def synthesize(args):
+    import pandas as pd  # Only needed for synthesis
+    files = sorted(glob.glob(os.path.join(args.data, "*.csv"))) if os.path.isdir(args.data) else [args.data]
+    chosen = {}
+    frames = []
+    for file in files:
+        for chunk in pd.read_csv(file, chunksize=1000000):
+            for employee in chunk['employee_id'].unique():
+                if args.agents is None or len(chosen) < args.agents:
+                    chosen.setdefault(employee, len(chosen))
+            frames.append(chunk[chunk['employee_id'].isin(list(chosen))])
+    df = pd.concat(frames)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format="%Y-%m-%d %H:%M:%S")
+    df = df.sort_values(['employee_id', 'timestamp'], kind='stable')
+    # Rows hold MB per hour, which is what agents report; daily usage adds up
+    # each rate over the time since the employee's previous row that day
+    hours = df.groupby('employee_id')['timestamp'].diff().dt.total_seconds().fillna(0) / 3600
+    df['used'] = (df['network_sent'] + df['network_received']) * hours
+    df['daily_usage'] = df.groupby(['employee_id', df['timestamp'].dt.date])['used'].cumsum()
+    origin = df['timestamp'].min()
+    anomalous = df['is_anomaly'].to_numpy() if 'is_anomaly' in df else df['is_suspicious'].to_numpy()
+
+    rng = random.Random(args.seed)
+    events = []
+    seqs = {}
+    for i, row in enumerate(df.itertuples(index=False)):
+        agent_id = f"agent_{row.employee_id}"
+        t = (row.timestamp - origin).total_seconds()
+        if agent_id not in seqs:
+            seqs[agent_id] = 0
+            events.append((t, 0, 'register_agent', agent_id, {
+                'agent_id': agent_id,
+                'session_id': f"{agent_id}-synthetic",
+                'system_name': f"host-{row.employee_id}",
+                'version': "1.0.0",
+                'current_user': row.employee_id,
+                'employee_id': row.employee_id,  # Baselines built from the same data are keyed by it
+                'status': 'active'
+            }))
+        seqs[agent_id] += 1
+        score = rng.uniform(0.5, 0.95) if anomalous[i] else rng.uniform(0.0, 0.25)
+        log = {
+            'seq': seqs[agent_id],
+            'timestamp': row.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            'activity': "Suspicious Process" if row.is_suspicious else "System Metrics",
+            'details': f"CPU {row.cpu}%, memory {row.memory_percent}%, {row.process_count} processes at {row.location}",
+            'anomaly_score': score,
+            'alerts': ["Unusual behavior pattern detected"] if score > 0.5 else []
+        }
+        events.append((t, 1, 'log_update', agent_id, {
+            'agent_id': agent_id,
+            'session_id': f"{agent_id}-synthetic",
+            'employee_id': row.employee_id,
+            'performance': {'cpu': row.cpu, 'memory_percent': row.memory_percent, 'disk_percent': row.disk_percent,
+                            'network_sent': row.network_sent, 'network_received': row.network_received},
+            'cpu_trend': [row.cpu] * 5,
+            'network_traffic': {'daily_usage': row.daily_usage},
+            'analysis': {'suspicious_patterns': [log['activity']] if score > 0.3 else [], 'risk_score': score * 10},
+            'logs': [log],
+            'buffer': {},
+            'file_events': {}
+        }))
+    events.sort(key=lambda event: event[:2])
+
+    recorder = TrafficRecorder(args.out)
+    for t, _, event, agent_id, payload in events:
+        recorder.record(event, agent_id, payload, t=t)
+    recorder.close()
+    span = events[-1][0] - events[0][0] if events else 0
+    print(f"Wrote {len(events):,} events for {len(seqs):,} agents spanning {span / 3600:.1f}h to {recorder.path}")
+
+# Simulated agents, built as traces so they replay like recorded ones
+def simulate_traces(args):
+    """Agents that register, then send random logs every interval for duration seconds."""
+    rng = random.Random(args.seed)
+    started = datetime.now()
+    traces = {}
+    for index in range(args.agents):
+        agent_id = f"load_{index:05d}"
+        session_id = f"{agent_id}-simulated"
+        events = [(0.0, 'register_agent', {
+            'agent_id': agent_id,
+            'session_id': session_id,
+            'system_name': f"host-{agent_id}",
+            'version': "1.0.0",
+            'current_user': "loadtest",
+            'status': 'active'
+        }, False)]
+        seq = 1
+        for k in range(int(args.duration / args.interval)):
+            t = k * args.interval
+            logs = []
+            for i in range(args.logs):
+                score = rng.random() ** 4  # Mostly low scores, a few high ones
+                logs.append({
+                    'seq': seq + i,
+                    'timestamp': (started + timedelta(seconds=t)).strftime("%Y-%m-%d %H:%M:%S"),
+                    'activity': rng.choice(ACTIVITIES),
+                    'details': f"Simulated event {seq + i}",
+                    'anomaly_score': score,
+                    'alerts': ["Suspicious activity"] if score > 0.5 else []
+                })
+            seq += args.logs
+            cpu = rng.uniform(5, 90)
+            events.append((t, 'log_update', {
+                'agent_id': agent_id,
+                'session_id': session_id,
+                'system_name': f"host-{agent_id}",
+                'version': "1.0.0",
+                'current_user': "loadtest",
+                'status': 'active',
+                'performance': {'cpu': cpu, 'memory_percent': 50, 'disk_percent': 60, 'network_sent': 1, 'network_received': 1},
+                'cpu_trend': [cpu] * 5,
+                'network_traffic': {'daily_usage': 2},
+                'analysis': {'suspicious_patterns': [], 'risk_score': 0},
+                'logs': logs
+            }, False))
+        traces[agent_id] = events
+    return traces
+
+# Replay
+def load_trace(path, max_agents):
+    """Group a trace's events by agent; packed updates are decoded so they can be re-addressed."""
+    agents = {}
+    for t, event, agent_id, payload in read_trace(path):
+        if agent_id not in agents:
+            if max_agents is not None and len(agents) >= max_agents:
+                continue
+            agents[agent_id] = []
+        packed = isinstance(payload, bytes)
+        agents[agent_id].append((t, event, decode_update(payload) if packed else payload, packed))
+    return agents
+
+def registration_for(update):
+    """Register an agent whose trace starts after it registered."""
+    return {
+        'agent_id': update['agent_id'],
+        'session_id': update.get('session_id'),
+        'system_name': update.get('system_name', update['agent_id']),
+        'version': update.get('version', "unknown"),
+        'current_user': update.get('current_user', "unknown"),
+        'employee_id': update.get('employee_id'),
+        'status': update.get('status', 'active')
+    }
+
+async def replay_agent(agent_id, events, origin, connect_at, start_at, args):
+    await asyncio.sleep(max(connect_at - time.monotonic(), 0))
+    sio = socketio.AsyncClient(reconnection=False)
+    try:
+        await sio.connect(args.url, transports=['websocket'])
+    except Exception:
+        stats['connect_errors'] += 1
+        return
+    stats['connected'] += 1
+    sessions = {}  # Recorded session -> a fresh one, so reruns aren't dropped as resends
+    registered = False
+    try:
+        for t, event, payload, packed in events:
+            if args.speed > 0:
+                delay = start_at + (t - origin) / args.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    stats['lag'] = max(stats['lag'], -delay)
+            data = dict(payload, agent_id=agent_id,
+                        session_id=sessions.setdefault(payload.get('session_id'), uuid.uuid4().hex))
+            try:
+                if event == 'register_agent':
+                    await sio.call('register_agent', data, timeout=30)
+                    registered = True
+                    continue
+                if not registered:
+                    await sio.call('register_agent', registration_for(data), timeout=30)
+                    registered = True
+                start = time.perf_counter()
+                if data['logs']:
+                    pending[agent_id].append((log_key(data['logs'][-1]), start))
+                ack = await sio.call('log_update', encode_update(data) if packed else data, timeout=30)
+                stats['ack_latencies'].append(time.perf_counter() - start)
+                stats['updates'] += 1
+                stats['logs'] += len(data['logs'])
+                if ack is None:
+                    stats['unacked'] += 1  # Server errors return no ack
+            except Exception:
+                stats['errors'] += 1
+        stats['finished_agents'] += 1
+    finally:
+        stats['connected'] -= 1
+        await sio.disconnect()
+
+def on_dashboard_update(frame):
+    now = time.perf_counter()
+    stats['frames'] += 1
+    for agent_id, fields in frame['agents'].items():
+        logs = fields.get('new_logs')
+        queue = pending.get(agent_id)
+        if not logs or not queue:
+            continue
+        # A frame carries every update up to the newest one it shows
+        newest = log_key(logs[-1])
+        delivered = next((i for i in range(len(queue) - 1, -1, -1) if queue[i][0] == newest), None)
+        if delivered is None:
+            continue
+        for _ in range(delivered + 1):
+            stats['dashboard_latencies'].append(now - queue.popleft()[1])
+
+async def connect_dashboard(url):
+    """Log in like a browser and join the dashboard room."""
+    async with aiohttp.ClientSession() as http:
+        async with http.post(f"{url}/login", data={'username': DASHBOARD_USER, 'password': DASHBOARD_PASSWORD},
+                             allow_redirects=False) as response:
+            if response.status != 302 or 'session' not in response.cookies:
+                raise RuntimeError(f"Dashboard login failed with HTTP {response.status}")
+            cookie = response.cookies['session'].value
+    dashboard = socketio.AsyncClient(reconnection=False)
+    dashboard.on('dashboard_update', on_dashboard_update)
+    await dashboard.connect(url, transports=['websocket'], headers={'Cookie': f"session={cookie}"})
+    return dashboard
+
+def server_rss(pid):
+    """Resident memory in MB of the server and its workers, or None."""
+    if pid is None:
+        return None
+    try:
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 2**20
+    except psutil.Error:
+        return None
+
+async def reporter(pid, total_agents):
+    last_updates = 0
+    last_time = time.monotonic()
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        now = time.monotonic()
+        rate = (stats['updates'] - last_updates) / (now - last_time)
+        last_updates, last_time = stats['updates'], now
+        rss = server_rss(pid)
+        if rss is not None:
+            stats['rss'].append(rss)
+        acks = sorted(stats['ack_latencies'][-5000:])
+        dashboard = sorted(stats['dashboard_latencies'][-5000:])
+        print(f"agents={stats['connected']:>6} done={stats['finished_agents']}/{total_agents}  updates/s={rate:>8.1f}  "
+              f"ack p50={percentile(acks, 0.5):6.1f} p99={percentile(acks, 0.99):7.1f} ms  "
+              f"dashboard p50={percentile(dashboard, 0.5):6.1f} p99={percentile(dashboard, 0.99):7.1f} ms  "
+              f"lag={stats['lag']:.1f}s  rss={'n/a' if rss is None else f'{rss:.0f} MB'}  errors={stats['errors']}")
+
+def spawn_server(args):
+    port = int(args.url.rsplit(':', 1)[1].split('/')[0])
+    env = dict(os.environ, THREXEL_ASYNC_MODE=args.async_mode)
+    log = open(args.server_log, 'ab') if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen([sys.executable, '-c', SERVER_BOOTSTRAP, str(port), '1' if args.mongomock else '0'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}; see --server-log")
+        try:
+            urllib.request.urlopen(f"{args.url}/metrics", timeout=1)
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server did not answer on {args.url} within {SERVER_START_TIMEOUT}s")
+
+async def replay(args, pid):
+    traces = load_trace(args.trace, args.agents) if args.command == 'replay' else simulate_traces(args)
+    origin = min((events[0][0] for events in traces.values() if events), default=0.0)
+    span = max((events[-1][0] for events in traces.values() if events), default=0.0) - origin
+    clients = [(f"{agent_id}-r{c}" if args.clones > 1 else agent_id, events)
+               for c in range(args.clones) for agent_id, events in traces.items()]
+    ramp_seconds = len(clients) / args.ramp
+    print(f"Replaying {len(traces):,} agents x{args.clones} ({span:.0f}s of traffic"
+          f"{f', {span / args.speed:.0f}s at {args.speed:g}x' if args.speed > 0 else ', unpaced'}) "
+          f"against {args.url} after a {ramp_seconds:.0f}s ramp")
+
+    dashboard = await connect_dashboard(args.url)
+    rss_before = server_rss(pid)
+    now = time.monotonic()
+    start_at = now + ramp_seconds + 1
+    report = asyncio.create_task(reporter(pid, len(clients)))
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        replay_agent(agent_id, events, origin, now + i / args.ramp, start_at + random.uniform(0, args.jitter), args)
+        for i, (agent_id, events) in enumerate(clients)
+    ])
+    elapsed = time.perf_counter() - started - ramp_seconds
+    await asyncio.sleep(args.drain)  # Let the last dashboard frames arrive
+    report.cancel()
+    await dashboard.disconnect()
+    rss_after = server_rss(pid)
+
+    acks = sorted(stats['ack_latencies'])
+    dashboard_latencies = sorted(stats['dashboard_latencies'])
+    rss = stats['rss'] + [value for value in (rss_before, rss_after) if value is not None]
+    summary = {
+        'agents': len(clients),
+        'updates': stats['updates'],
+        'logs': stats['logs'],
+        'updates_per_second': stats['updates'] / elapsed if elapsed > 0 else 0.0,
+        'logs_per_second': stats['logs'] / elapsed if elapsed > 0 else 0.0,
+        'ack_ms': {'p50': percentile(acks, 0.5), 'p99': percentile(acks, 0.99), 'max': percentile(acks, 1.0)},
+        'dashboard_ms': {'p50': percentile(dashboard_latencies, 0.5), 'p95': percentile(dashboard_latencies, 0.95),
+                         'p99': percentile(dashboard_latencies, 0.99), 'max': percentile(dashboard_latencies, 1.0)},
+        'dashboard_frames': stats['frames'],
+        'updates_not_seen_on_dashboard': sum(len(queue) for queue in pending.values()),
+        'max_lag_seconds': stats['lag'],
+        'rss_mb': {'start': rss_before, 'end': rss_after, 'peak': max(rss) if rss else None},
+        'connect_errors': stats['connect_errors'],
+        'errors': stats['errors'],
+        'unacked': stats['unacked']
+    }
+    print("\nSummary")
+    print(f"  Agents: {summary['agents']:,}  Updates: {summary['updates']:,} ({summary['updates_per_second']:.1f}/s)  "
+          f"Logs: {summary['logs']:,} ({summary['logs_per_second']:.1f}/s)")
+    print(f"  log_update ack: p50={summary['ack_ms']['p50']:.1f} ms  p99={summary['ack_ms']['p99']:.1f} ms  "
+          f"max={summary['ack_ms']['max']:.1f} ms")
+    print(f"  Update to dashboard: p50={summary['dashboard_ms']['p50']:.1f} ms  p95={summary['dashboard_ms']['p95']:.1f} ms  "
+          f"p99={summary['dashboard_ms']['p99']:.1f} ms  ({summary['dashboard_frames']} frames, "
+          f"{summary['updates_not_seen_on_dashboard']} updates never shown)")
+    if rss_before is not None:
+        print(f"  Server RSS: {rss_before:.0f} MB -> {rss_after:.0f} MB (peak {summary['rss_mb']['peak']:.0f} MB)")
+    print(f"  Max lag behind schedule: {stats['lag']:.2f}s")
+    print(f"  Failed connections: {stats['connect_errors']}  Failed updates: {stats['errors']}  Unacked: {stats['unacked']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record-and-replay load harness for Server.py")
+    commands = parser.add_subparsers(dest='command', required=True)
+    synth = commands.add_parser('synthesize', help="Build a trace from generated employee data")
+    synth.add_argument('data', help="CSV file or directory of CSV parts from \"genrate data.py\"")
+    synth.add_argument('out', help="Trace to write; .gz to compress")
+    synth.add_argument('--agents', type=int, help="Only the first N employees")
+    synth.add_argument('--seed', type=int, default=42)
+    # Options shared by everything that sends traffic
+    target = argparse.ArgumentParser(add_help=False)
+    target.add_argument('--url', default="http://127.0.0.1:5000")
+    target.add_argument('--ramp', type=float, default=200, help="New connections per second")
+    target.add_argument('--jitter', type=float, default=1.0, help="Max seconds each client's schedule is shifted by")
+    target.add_argument('--drain', type=float, default=2.0, help="Seconds to wait for dashboard frames at the end")
+    target.add_argument('--server-pid', type=int, help="Process to report RSS for (workers are included)")
+    target.add_argument('--spawn', action='store_true', help="Start Server.py on the --url port for the run")
+    target.add_argument('--mongomock', action='store_true', help="With --spawn, store logs in mongomock")
+    target.add_argument('--async-mode', default='threading', choices=['threading', 'gevent'], help="With --spawn")
+    target.add_argument('--server-log', help="With --spawn, append the server's output here")
+    target.add_argument('--json', help="Also write the summary to this file")
+    play = commands.add_parser('replay', parents=[target], help="Replay a trace against a server")
+    play.add_argument('trace')
+    play.add_argument('--speed', type=float, default=1.0, help="Playback speed multiplier; 0 sends as fast as acks allow")
+    play.add_argument('--agents', type=int, help="Only the first N agents of the trace")
+    play.add_argument('--clones', type=int, default=1, help="Simulated clients per recorded agent")
+    simulate = commands.add_parser('simulate', parents=[target], help="Load test with simulated agents")
+    simulate.add_argument('--agents', type=int, default=1000)
+    simulate.add_argument('--duration', type=float, default=60, help="Seconds each agent sends updates for")
+    simulate.add_argument('--interval', type=float, default=1.0, help="Seconds between updates per agent")
+    simulate.add_argument('--logs', type=int, default=5, help="Logs per update")
+    simulate.add_argument('--seed', type=int, default=42)
+    simulate.set_defaults(speed=1.0, clones=1)
+    args = parser.parse_args()
+
+    if args.command == 'synthesize':
+        synthesize(args)
+    else:
+        server = spawn_server(args) if args.spawn else None
+        try:
+            asyncio.run(replay(args, server.pid if server else args.server_pid))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
@@ -0,0 +1,204 @@
+import json
+import os
+import pickle
+import queue
+import sys
+import threading
+from multiprocessing.managers import BaseManager
+import socketio
+
+# Configuration
+STATE_AUTHKEY = os.environ.get('THREXEL_STATE_AUTHKEY')  # Required by the manager:// broker; no default
+SUBSCRIBER_QUEUE_SIZE = 10000  # Messages buffered per subscriber before new ones are dropped
+REDIS_AGENTS_KEY = 'threxel:agents'
+
+# Shared agent registry and pub/sub for running Server.py in several worker
+# processes. SHARED_STATE_URL selects the backend:
+#   None                             - this process only (single worker)
+#   redis://host:6379/0              - Redis hash plus Redis pub/sub
+#   manager:///tmp/threxel-state.sock - broker started with `python shared_state.py`
+# The broker unpickles what its clients send, so it and every worker must share
+# a secret THREXEL_STATE_AUTHKEY, and its socket is only accessible to its user.
+
+# Agent registry kept in this process
+class LocalAgentStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.agents = {}
+
+    def get(self, agent_id):
+        return self.agents.get(agent_id)
+
+    def set(self, agent_id, agent):
+        with self.lock:
+            self.agents[agent_id] = agent
+
+    def delete(self, agent_id):
+        with self.lock:
+            self.agents.pop(agent_id, None)
+
+    def all(self):
+        with self.lock:
+            return list(self.agents.values())
+
+# Agent registry in a Redis hash of JSON documents
+class RedisAgentStore:
+    def __init__(self, url):
+        import redis  # Only needed for the Redis backend
+        self.redis = redis.Redis.from_url(url)
+
+    def get(self, agent_id):
+        value = self.redis.hget(REDIS_AGENTS_KEY, agent_id)
+        return json.loads(value) if value else None
+
+    def set(self, agent_id, agent):
+        self.redis.hset(REDIS_AGENTS_KEY, agent_id, json.dumps(agent, default=str))
+
+    def delete(self, agent_id):
+        self.redis.hdel(REDIS_AGENTS_KEY, agent_id)
+
+    def all(self):
+        return [json.loads(value) for value in self.redis.hvals(REDIS_AGENTS_KEY)]
+
+# Agent registry and message fan-out held by the broker process
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.agents = {}
+        self.subscribers = {}
+        self.next_subscriber = 0
+        self.dropped = 0
+
+    def get_agent(self, agent_id):
+        return self.agents.get(agent_id)
+
+    def set_agent(self, agent_id, agent):
+        with self.lock:
+            self.agents[agent_id] = agent
+
+    def delete_agent(self, agent_id):
+        with self.lock:
+            self.agents.pop(agent_id, None)
+
+    def all_agents(self):
+        with self.lock:
+            return list(self.agents.values())
+
+    def subscribe(self):
+        with self.lock:
+            self.next_subscriber += 1
+            self.subscribers[self.next_subscriber] = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+            return self.next_subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.pop(subscriber, None)
+
+    def publish(self, message):
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+        for messages in subscribers:
+            try:
+                messages.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+
+    def receive(self, subscriber, timeout=1.0):
+        """Wait for the next message for a subscriber; None on timeout."""
+        try:
+            return self.subscribers[subscriber].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class StateManager(BaseManager):
+    pass
+
+StateManager.register('get_broker')
+
+def state_authkey():
+    if not STATE_AUTHKEY:
+        raise RuntimeError("THREXEL_STATE_AUTHKEY must be set to a shared secret to use the manager:// broker")
+    return STATE_AUTHKEY.encode()
+
+def connect_broker(url):
+    manager = StateManager(address=url[len('manager://'):], authkey=state_authkey())
+    manager.connect()
+    return manager.get_broker()
+
+# Agent registry held by the broker process
+class ManagerAgentStore:
+    def __init__(self, url):
+        self.broker = connect_broker(url)
+
+    def get(self, agent_id):
+        return self.broker.get_agent(agent_id)
+
+    def set(self, agent_id, agent):
+        self.broker.set_agent(agent_id, agent)
+
+    def delete(self, agent_id):
+        self.broker.delete_agent(agent_id)
+
+    def all(self):
+        return self.broker.all_agents()
+
+# Socket.IO client manager that relays emits between processes through the broker
+class ManagerPubSub(socketio.PubSubManager):
+    name = 'manager'
+
+    def __init__(self, url, channel='flask-socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.url = url
+        self.broker = connect_broker(url)
+
+    def _publish(self, data):
+        self.broker.publish(pickle.dumps(data))
+
+    def _listen(self):
+        broker = connect_broker(self.url)  # Own connection so waiting never blocks publishers
+        subscriber = broker.subscribe()
+        try:
+            while True:
+                message = broker.receive(subscriber)
+                if message is not None:
+                    yield message
+        finally:
+            broker.unsubscribe(subscriber)
+
+def create_agent_store(url):
+    if not url:
+        return LocalAgentStore()
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisAgentStore(url)
+    if url.startswith('manager://'):
+        return ManagerAgentStore(url)
+    raise ValueError(f"Unsupported shared state URL: {url}")
+
+def create_client_manager(url):
+    """Return the Socket.IO client manager for url, or None for a single process."""
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel='flask-socketio')
+    if url.startswith('manager://'):
+        return ManagerPubSub(url)
+    raise ValueError(f"Unsupported shared state URL: {url}")
+
+def serve(address):
+    """Run the broker on a Unix socket until interrupted."""
+    authkey = state_authkey()
+    broker = Broker()
+    StateManager.register('get_broker', callable=lambda: broker)
+    if os.path.exists(address):
+        os.remove(address)
+    manager = StateManager(address=address, authkey=authkey)
+    umask = os.umask(0o177)  # Socket created 0600
+    try:
+        server = manager.get_server()
+    finally:
+        os.umask(umask)
+    print(f"Shared state broker listening on {address}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else '/tmp/threxel-state.sock')
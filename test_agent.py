@@ -0,0 +1,95 @@
+import pytest
+import Agent
+from wire_format import PACKED_FORMAT, decode_update
+
+# Run with: python -m pytest test_agent.py
+
+class StubClient:
+    """Stands in for the Socket.IO client: connected, records emits."""
+    connected = True
+    sid = 'stub'
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, callback=None):
+        self.emitted.append((event, data, callback))
+
+@pytest.fixture
+def outbox():
+    logs = Agent.LogOutbox(capacity=100, spill_dir=None)
+    for i in range(3):
+        logs.append(Agent.log_activity("Process Started", f"Event {i}", anomaly_score=0.1))
+    return logs
+
+@pytest.mark.parametrize('wire_format', [None, PACKED_FORMAT])
+def test_send_update(monkeypatch, outbox, wire_format):
+    client = StubClient()
+    monkeypatch.setattr(Agent, 'sio', client)
+    monkeypatch.setitem(Agent.wire_state, 'format', wire_format)
+    updates_sent = Agent.metrics.counters['updates_sent']
+    errors = Agent.metrics.counters['send_errors']
+
+    assert Agent.send_update(outbox) == 3
+    event, data, callback = client.emitted[0]
+    assert event == 'log_update' and callback == outbox.on_ack
+    update = decode_update(data) if wire_format else data
+    assert [log['details'] for log in update['logs']] == ["Event 0", "Event 1", "Event 2"]
+    assert set(update['performance']) == {'cpu', 'memory_percent', 'disk_percent', 'network_sent', 'network_received'}
+    assert update['process_io'] == []  # No metrics sample yet
+    assert Agent.metrics.counters['updates_sent'] == updates_sent + 1
+    assert Agent.metrics.counters['send_errors'] == errors
+
+def test_send_update_counts_emit_errors(monkeypatch, outbox):
+    client = StubClient()
+    def fail(*args, **kwargs):
+        raise ConnectionError("gone")
+    client.emit = fail
+    monkeypatch.setattr(Agent, 'sio', client)
+    errors = Agent.metrics.counters['send_errors']
+    assert Agent.send_update(outbox) == 0
+    assert Agent.metrics.counters['send_errors'] == errors + 1
+
+def test_send_update_while_disconnected(monkeypatch, outbox):
+    client = StubClient()
+    client.connected = False
+    monkeypatch.setattr(Agent, 'sio', client)
+    assert Agent.send_update(outbox) == 0 and client.emitted == []
+
+class FailingWriter:
+    """Writes part of a line to the real segment, then fails like a full disk."""
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, data):
+        self.writer.write(data[:len(data) // 2])
+        raise OSError(28, "No space left on device")
+
+    def close(self):
+        self.writer.close()
+
+def record(seq):
+    return Agent.LogRecord(seq, Agent.log_activity("File Modified", f"Event {seq}"))
+
+def test_spill_write_error_keeps_offsets(tmp_path):
+    store = Agent.SpillStore(str(tmp_path))
+    store.append(record(1))
+    store.writer = FailingWriter(store.writer)
+    store.append(record(2))
+    assert store.dropped == 1
+    for seq in range(3, 6):
+        store.append(record(seq))
+    assert [log['details'] for log in store.read(10)] == ["Event 1", "Event 3", "Event 4", "Event 5"]
+    assert [log['details'] for log in store.read(10, after=3)] == ["Event 4", "Event 5"]
+    store.ack(4)
+    assert [log['details'] for log in store.read(10)] == ["Event 5"]
+    # A restart recovers what wasn't acked, and nothing of the torn line
+    assert [log['details'] for log in Agent.SpillStore(str(tmp_path)).take_leftovers()] == ["Event 5"]
+
+def test_spill_reads_stop_at_torn_line(tmp_path):
+    store = Agent.SpillStore(str(tmp_path))
+    store.append(record(1))
+    store.segments[-1][1] += 4  # Recorded size past the last newline
+    with open(store.segments[-1][0], 'ab') as f:
+        f.write(b"2\t{\"")
+    assert [log['details'] for log in store.read(10)] == ["Event 1"]
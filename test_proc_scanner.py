@@ -0,0 +1,101 @@
+import os
+import proc_scanner
+
+# Run with: python -m pytest test_proc_scanner.py
+
+# Fields after comm as in /proc/<pid>/stat: state, ppid, ..., start time is the 20th
+STAT_TAIL = b"S 1 42 42 0 -1 4194560 100 0 0 0 5 3 0 0 20 0 1 0 123456 1000000 200"
+
+def stat_line(pid, comm):
+    return b"%d (%s) %s\n" % (pid, comm, STAT_TAIL)
+
+IO = b"""rchar: 1000
+wchar: 2000
+syscr: 10
+syscw: 20
+read_bytes: 4096
+write_bytes: 8192
+cancelled_write_bytes: 0
+"""
+
+NET_DEV = b"""Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:  500000     100    0    0    0     0          0         0   500000     100    0    0    0     0       0          0
+  eth0: 1234567    1000    0    0    0     0          0         0   765432     900    0    0    0     0       0          0
+ wlan0:      10       1    0    0    0     0          0         0       20       2    0    0    0     0       0          0
+"""
+
+def make_proc(root, processes, net_dev=NET_DEV):
+    """A fake /proc with {pid: (comm, io or None)} processes and /proc/net/dev."""
+    for pid, (comm, io) in processes.items():
+        os.makedirs(root / str(pid))
+        (root / str(pid) / 'stat').write_bytes(stat_line(pid, comm))
+        if io is not None:
+            (root / str(pid) / 'io').write_bytes(io)
+    os.makedirs(root / 'net')
+    (root / 'net' / 'dev').write_bytes(net_dev)
+    return str(root)
+
+def test_parse_stat():
+    assert proc_scanner.parse_stat(stat_line(7, b"python3")) == ("python3", 1, 123456)
+
+def test_parse_stat_comm_with_parentheses_and_spaces():
+    # A process can name itself anything, including ") (" and a fake field list
+    comm, ppid, start = proc_scanner.parse_stat(stat_line(7, b"a) (b) S 99 99"))
+    assert (comm, ppid, start) == ("a) (b) S 99 99", 1, 123456)
+
+def test_parse_stat_undecodable_comm():
+    comm, _, _ = proc_scanner.parse_stat(stat_line(7, b"bad\xffname"))
+    assert comm == "bad\ufffdname"
+
+def test_parse_io():
+    assert proc_scanner.parse_io(IO) == (1000, 2000)
+
+def test_read_network_skips_loopback(tmp_path):
+    proc = make_proc(tmp_path, {})
+    assert proc_scanner.read_network(proc) == {'eth0': (1234567, 765432), 'wlan0': (10, 20)}
+
+def test_network_deltas():
+    previous = {'eth0': (1000, 500)}
+    current = {'eth0': (1500, 800)}
+    assert proc_scanner.network_deltas(previous, current) == (500, 300)
+
+def test_network_deltas_counter_reset():
+    # eth0 went backwards (driver reload): count from zero; wlan0 is new
+    previous = {'eth0': (1000000, 900000)}
+    current = {'eth0': (300, 200), 'wlan0': (50, 40)}
+    assert proc_scanner.network_deltas(previous, current) == (350, 240)
+
+def test_network_deltas_removed_interface():
+    assert proc_scanner.network_deltas({'eth0': (10, 10), 'usb0': (5, 5)}, {'eth0': (15, 12)}) == (5, 2)
+
+def test_process_name_uses_exe_when_comm_is_cut():
+    assert proc_scanner.process_name("chromium-browse", "/usr/lib/chromium/chromium-browser") == "chromium-browser"
+    assert proc_scanner.process_name("bash", "/usr/bin/bash") == "bash"
+    assert proc_scanner.process_name("kworker/0:1", '') == "kworker/0:1"
+
+def test_scan_fixture(tmp_path):
+    proc = make_proc(tmp_path, {1: (b"init", IO), 20: (b"a) (b", None), 300: (b"worker", IO)})
+    os.makedirs(tmp_path / 'self')  # Non-numeric entries are skipped
+    snapshot = proc_scanner.ProcScanner(proc=proc).scan()
+    rows = {int(pid): row for row, pid in enumerate(snapshot.pid)}
+    assert sorted(rows) == [1, 20, 300]
+    assert snapshot.comm[rows[20]] == "a) (b"
+    assert snapshot.io_read[rows[1]] == 1000 and snapshot.io_write[rows[1]] == 2000
+    assert snapshot.io_read[rows[20]] == -1  # No io file
+    assert snapshot.network == {'eth0': (1234567, 765432), 'wlan0': (10, 20)}
+
+def test_new_rows_and_io_rates(tmp_path):
+    proc = make_proc(tmp_path, {1: (b"init", IO)})
+    scanner = proc_scanner.ProcScanner(proc=proc)
+    previous = scanner.scan()
+    os.makedirs(tmp_path / '2')
+    (tmp_path / '2' / 'stat').write_bytes(stat_line(2, b"new"))
+    (tmp_path / '1' / 'io').write_bytes(IO.replace(b"rchar: 1000", b"rchar: 3000"))
+    current = scanner.scan()
+    new = proc_scanner.new_rows(previous, current)
+    assert [int(current.pid[row]) for row in new] == [2]
+    rows, reads, writes = proc_scanner.process_io_rates(previous, current)
+    elapsed = current.time - previous.time
+    assert [int(current.pid[row]) for row in rows] == [1]
+    assert abs(reads[0] * elapsed - 2000) < 1e-6 and writes[0] == 0
@@ -0,0 +1,107 @@
+import math
+import struct
+import pytest
+import wire_format
+
+# Run with: python -m pytest test_wire_format.py
+
+def make_update(logs, **fields):
+    # Values are exact in float32 so round trips compare equal
+    update = {
+        'agent_id': "agent_1",
+        'session_id': "agent_1-session",
+        'performance': {'cpu': 12.5, 'memory_percent': 50.0, 'disk_percent': 75.25,
+                        'network_sent': 1234.5678, 'network_received': 0.1},
+        'network_traffic': {'daily_usage': 5000.0},
+        'buffer': {'pending': 3, 'dropped': 0},
+        'file_events': {'created': 7},
+        'process_io': [{'pid': 4321, 'name': "rsync", 'read_bytes_per_second': 1048576.0, 'write_bytes_per_second': 512.0}],
+        'logs': logs
+    }
+    update.update(fields)
+    return update
+
+def make_log(seq, activity="Process Started", score=0.25, alerts=()):
+    return {
+        'seq': seq,
+        'timestamp': "2026-01-01 10:00:00",
+        'activity': activity,
+        'details': f"Event {seq}",
+        'anomaly_score': score,
+        'alerts': list(alerts)
+    }
+
+def test_round_trip():
+    logs = [make_log(100), make_log(101, "File Modified", 0.75, ["Suspicious activity", "Unusual hour"]), make_log(105)]
+    update = make_update(logs)
+    decoded = wire_format.decode_update(wire_format.encode_update(update))
+    assert decoded['agent_id'] == "agent_1" and decoded['session_id'] == "agent_1-session"
+    assert decoded['performance'] == update['performance']
+    assert decoded['buffer'] == update['buffer'] and decoded['file_events'] == update['file_events']
+    assert decoded['process_io'] == update['process_io']
+    assert decoded['logs'] == logs
+    assert decoded['analysis']['suspicious_patterns'] == ["File Modified"]
+
+def test_empty_update():
+    update = make_update([], buffer=None, file_events=None, process_io=None)
+    decoded = wire_format.decode_update(wire_format.encode_update(update))
+    assert decoded['logs'] == [] and decoded['buffer'] == {} and decoded['file_events'] == {}
+    assert decoded['process_io'] == []
+
+def test_daily_usage_is_sent_not_derived():
+    # network_sent and network_received are MB per hour; today's total is separate
+    update = make_update([])
+    update['performance'].update(network_sent=12.0, network_received=30.0)
+    decoded = wire_format.decode_update(wire_format.encode_update(update))
+    assert decoded['network_traffic'] == {'daily_usage': 5000.0}
+    assert decoded['performance']['network_sent'] == 12.0 and decoded['performance']['network_received'] == 30.0
+
+def test_unicode_strings():
+    log = make_log(1, "Zugriff verweigert", alerts=["Ungewöhnlicher Zugriff ⚠"])
+    log['details'] = "C:\\Users\\Jürgen\\日本語.txt"
+    decoded = wire_format.decode_update(wire_format.encode_update(make_update([log])))
+    assert decoded['logs'] == [log]
+
+def test_large_string_table_is_compressed():
+    logs = [make_log(i) for i in range(50)]
+    payload = wire_format.encode_update(make_update(logs))
+    assert payload[1] & wire_format.FLAG_COMPRESSED
+    assert wire_format.decode_update(payload)['logs'] == logs
+
+def test_small_string_table_is_not_compressed():
+    payload = wire_format.encode_update(make_update([make_log(1)]))
+    assert not payload[1] & wire_format.FLAG_COMPRESSED
+
+def test_features_section():
+    logs = [make_log(1), make_log(2), make_log(3)]
+    logs[0].update(features=[0.5, 1.0, -2.25], threshold=0.625)
+    logs[2].update(features=[4.0], threshold=None)
+    payload = wire_format.encode_update(make_update(logs))
+    assert payload[1] & wire_format.FLAG_FEATURES
+    decoded = wire_format.decode_update(payload)['logs']
+    assert decoded[0]['features'] == [0.5, 1.0, -2.25] and decoded[0]['threshold'] == 0.625
+    assert 'features' not in decoded[1] and 'threshold' not in decoded[1]
+    assert decoded[2]['features'] == [4.0] and decoded[2]['threshold'] is None
+
+def test_no_features_section_without_features():
+    payload = wire_format.encode_update(make_update([make_log(1)]))
+    assert not payload[1] & wire_format.FLAG_FEATURES
+    assert 'features' not in wire_format.decode_update(payload)['logs'][0]
+
+def test_features_are_float32():
+    log = make_log(1)
+    log.update(features=[0.1], threshold=0.3)
+    decoded = wire_format.decode_update(wire_format.encode_update(make_update([log])))['logs'][0]
+    assert decoded['features'][0] == struct.unpack('<f', struct.pack('<f', 0.1))[0]
+    assert math.isclose(decoded['threshold'], 0.3, rel_tol=1e-6)
+
+def test_unsupported_version():
+    payload = bytearray(wire_format.encode_update(make_update([make_log(1)])))
+    payload[0] = wire_format.VERSION + 1
+    with pytest.raises(ValueError):
+        wire_format.decode_update(bytes(payload))
+
+def test_too_many_strings():
+    logs = [make_log(i) for i in range(0xFFFF)]
+    with pytest.raises(ValueError):
+        wire_format.encode_update(make_update(logs))
@@ -0,0 +1,75 @@
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# Traces of the Socket.IO events agents send the server, written by Server.py
+# when THREXEL_RECORD=<path> is set and played back by "replay traffic.py".
+# A path ending in .gz is compressed; "{pid}" in the path is replaced by the
+# worker's process id, so several Gunicorn workers don't share one file.
+#
+# One JSON object per line:
+#   header   {"format": "threxel-traffic", "version": 1, "recorded_at": ...}
+#   events   {"t": seconds since recording started, "event": "register_agent"
+#            or "log_update", "agent_id": ..., "data": payload}
+# Packed updates (see wire_format.py) are stored base64-encoded under
+# "packed" instead of "data", so they are replayed byte for byte.
+
+TRACE_FORMAT = 'threxel-traffic'
+TRACE_VERSION = 1
+FLUSH_INTERVAL = 1.0  # Seconds between flushes of recorded events to disk
+
+def open_trace(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+class TrafficRecorder:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.path = path.replace('{pid}', str(os.getpid()))
+        self.file = open_trace(self.path, 'w')
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.events = 0
+        header = {'format': TRACE_FORMAT, 'version': TRACE_VERSION, 'recorded_at': datetime.now(timezone.utc).isoformat()}
+        self.file.write(json.dumps(header) + "\n")
+
+    def record(self, event, agent_id, payload, t=None):
+        """Append one event; t defaults to the time since recording started."""
+        now = time.monotonic()
+        entry = {'t': round(now - self.start if t is None else t, 6), 'event': event, 'agent_id': agent_id}
+        if isinstance(payload, bytes):
+            entry['packed'] = base64.b64encode(payload).decode('ascii')
+        else:
+            entry['data'] = payload
+        line = json.dumps(entry, default=str) + "\n"  # Serialized outside the lock
+        with self.lock:
+            self.file.write(line)
+            self.events += 1
+            if now - self.last_flush >= FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def read_trace(path):
+    """Yield (t, event, agent_id, payload) per event; payload is bytes for packed updates."""
+    with open_trace(path, 'r') as f:
+        header = json.loads(f.readline() or '{}')
+        if header.get('format') != TRACE_FORMAT or header.get('version') != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} {TRACE_FORMAT} trace")
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # Last line cut short when the server was killed
+            payload = base64.b64decode(entry['packed']) if 'packed' in entry else entry['data']
+            yield entry['t'], entry['event'], entry['agent_id'], payload
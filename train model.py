@@ -1,36 +1,218 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.ensemble import IsolationForest
+from sklearn.ensemble._iforest import _average_path_length
 import joblib
+from flat_forest import install_model
 
 # Configuration
-DATA_FILE = "employee_behavior_data.csv"
+DATA_FILE = "employee_behavior_data.csv"  # A CSV/Parquet file, or a directory of part files
 MODEL_FILE = "anomaly_model.pkl"
+EXPORT_FILE = "anomaly_model.npz"  # Flat-array forest loaded by the agent
+MODEL_DIR = "models"  # Versioned artifacts and their metadata
 CONTAMINATION = 0.1  # Expected anomaly ratio
-
-# Load data
-print("Loading synthetic data...")
-df = pd.read_csv(DATA_FILE)
+N_ESTIMATORS = 100
+MAX_SAMPLES = 256  # Rows each tree is built from
+SAMPLE_ROWS = 200000  # Uniform sample of the stream kept for fitting and the threshold
+CHUNK_ROWS = 1000000  # Rows read at a time
+N_JOBS = -1  # Build trees on every core
+RANDOM_STATE = 42
 
 # Select features for training (exclude employee_id, timestamp, location)
-features = ['cpu', 'memory_percent', 'disk_percent', 'network_sent', 
+FEATURES = ['cpu', 'memory_percent', 'disk_percent', 'network_sent',
             'network_received', 'process_count', 'is_suspicious']
-X = df[features].values
-
-# Initialize and train model
-print("Training Isolation Forest model...")
-model = IsolationForest(contamination=CONTAMINATION, random_state=42, n_estimators=100)
-model.fit(X)
-
-# Save model
-joblib.dump(model, MODEL_FILE)
-print(f"Model saved to {MODEL_FILE}")
-
-# Validate model
-print("Validating model...")
-scores = -model.decision_function(X)
-anomaly_scores = (scores + 1) / 2  # Normalize to [0, 1]
-predicted_anomalies = model.predict(X)
-num_anomalies = np.sum(predicted_anomalies == -1)
-print(f"Predicted anomalies: {num_anomalies} ({num_anomalies/len(X)*100:.2f}%)")
-print(f"Average anomaly score: {np.mean(anomaly_scores):.3f}")
\ No newline at end of file
+LABEL = 'is_anomaly'  # Ground truth written by "genrate data.py"
+# float32 is what the trees compare in, so reading wider only costs memory
+DTYPES = {feature: np.float32 for feature in FEATURES}
+DTYPES[LABEL] = np.int8
+
+def export_forest(model, path, version=None):
+    """Write the forest's trees as flat NumPy arrays for the agent's scorer.
+
+    Leaves point to themselves so the agent can walk every tree a fixed
+    max_depth steps, and each node stores the path length a sample ending
+    there contributes, exactly as IsolationForest.score_samples adds it.
+    """
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    subsample_features = model._max_features != model.n_features_in_
+    offset = 0
+    max_depth = 0
+    for i, (estimator, features) in enumerate(zip(model.estimators_, model.estimators_features_)):
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        nodes = np.arange(tree.node_count)
+        tree_feature = np.where(is_leaf, 0, tree.feature)
+        if subsample_features:
+            tree_feature = np.asarray(features)[tree_feature]
+        left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        feature.append(tree_feature)
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        value.append(model._decision_path_lengths[i] + model._average_path_length_per_tree[i] - 1.0)
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+    np.savez(
+        path,
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        feature=np.concatenate(feature).astype(np.int32),
+        threshold=np.concatenate(threshold).astype(np.float64),
+        value=np.concatenate(value).astype(np.float64),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        denominator=len(model.estimators_) * _average_path_length([model._max_samples])[0],
+        offset=model.offset_,
+        n_features=model.n_features_in_,
+        version=version or ''  # Lets the server report which model it is scoring with
+    )
+
+def data_files(path):
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "*.csv")) + glob.glob(os.path.join(path, "*.parquet")))
+    return [path]
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yield (features, labels or None) arrays chunk by chunk."""
+    for file in data_files(path):
+        if file.endswith(".parquet"):
+            import pyarrow.parquet as pq  # Only needed for Parquet input
+            parquet = pq.ParquetFile(file)
+            columns = FEATURES + ([LABEL] if LABEL in parquet.schema_arrow.names else [])
+            chunks = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns))
+        else:
+            header = pd.read_csv(file, nrows=0).columns
+            columns = FEATURES + ([LABEL] if LABEL in header else [])
+            chunks = pd.read_csv(file, usecols=columns, dtype={c: DTYPES[c] for c in columns}, chunksize=chunk_rows)
+        for chunk in chunks:
+            labels = chunk[LABEL].to_numpy() if LABEL in chunk else None
+            yield chunk[FEATURES].to_numpy(dtype=np.float32), labels
+
+def sample_stream(path, sample_rows, chunk_rows, seed):
+    """Uniformly sample sample_rows rows from the stream (bottom-k random keys)."""
+    rng = np.random.default_rng(seed)
+    sample = np.empty((0, len(FEATURES)), dtype=np.float32)
+    keys = np.empty(0)
+    total = 0
+    for X, _ in read_chunks(path, chunk_rows):
+        total += len(X)
+        sample = np.concatenate([sample, X])
+        keys = np.concatenate([keys, rng.random(len(X))])
+        if len(sample) > sample_rows:
+            keep = np.argpartition(keys, sample_rows)[:sample_rows]
+            sample, keys = sample[keep], keys[keep]
+    return sample[np.argsort(keys)], total
+
+def save_artifacts(model, metadata):
+    """Write the versioned artifact and metadata, then point the live files at it."""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    base = os.path.join(MODEL_DIR, f"anomaly_model-{metadata['version']}")
+    joblib.dump(model, base + ".pkl")
+    export_forest(model, base + ".npz", metadata['version'])
+    with open(base + ".json", "w") as f:
+        json.dump(metadata, f, indent=2)
+    # Replaced atomically: the server reloads EXPORT_FILE as soon as it changes
+    install_model(base + ".pkl", MODEL_FILE)
+    install_model(base + ".npz", EXPORT_FILE)
+    return base
+
+def evaluate(model, path, chunk_rows):
+    """Score every row in chunks; returns throughput and label metrics."""
+    rows = flagged = 0
+    tp = fp = fn = 0
+    labelled = True
+    seconds = 0.0
+    for X, labels in read_chunks(path, chunk_rows):
+        start = time.perf_counter()
+        predicted = model.predict(X) == -1
+        seconds += time.perf_counter() - start
+        rows += len(X)
+        flagged += int(predicted.sum())
+        if labels is None:
+            labelled = False
+            continue
+        actual = labels.astype(bool)
+        tp += int(np.sum(predicted & actual))
+        fp += int(np.sum(predicted & ~actual))
+        fn += int(np.sum(~predicted & actual))
+    results = {'rows': rows, 'flagged': flagged, 'rows_per_second': rows / seconds if seconds else 0.0}
+    if labelled and rows:
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        results.update({
+            'precision': precision,
+            'recall': recall,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the anomaly model from synthetic data")
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--eval-data', help="Data to evaluate on; defaults to the training data")
+    parser.add_argument('--sample-rows', type=int, default=SAMPLE_ROWS)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--jobs', type=int, default=N_JOBS)
+    parser.add_argument('--skip-eval', action='store_true')
+    args = parser.parse_args()
+
+    # Load data
+    print(f"Sampling up to {args.sample_rows:,} rows from {args.data}...")
+    start = time.perf_counter()
+    X, total_rows = sample_stream(args.data, args.sample_rows, args.chunk_rows, RANDOM_STATE)
+    read_seconds = time.perf_counter() - start
+    print(f"Read {total_rows:,} rows in {read_seconds:.1f}s, kept {len(X):,}")
+
+    # Initialize and train model
+    print("Training Isolation Forest model...")
+    model = IsolationForest(contamination=CONTAMINATION, random_state=RANDOM_STATE, n_estimators=N_ESTIMATORS,
+                            max_samples=min(MAX_SAMPLES, len(X)), n_jobs=args.jobs)
+    start = time.perf_counter()
+    model.fit(X)
+    fit_seconds = time.perf_counter() - start
+    print(f"Fit in {fit_seconds:.2f}s")
+
+    # Save model
+    training_hash = hashlib.sha256(np.ascontiguousarray(X).tobytes()).hexdigest()
+    created = datetime.now(timezone.utc)
+    metadata = {
+        'version': f"{created:%Y%m%dT%H%M%SZ}-{training_hash[:8]}",
+        'created_at': created.isoformat(),
+        'features': FEATURES,  # Column order the model expects
+        'contamination': CONTAMINATION,
+        'n_estimators': N_ESTIMATORS,
+        'max_samples': model.max_samples_,
+        'offset': float(model.offset_),
+        'training_hash': training_hash,  # SHA-256 of the float32 training sample
+        'training_rows': len(X),
+        'source_rows': total_rows,
+        'source_files': data_files(args.data),
+        'fit_seconds': fit_seconds,
+        'sklearn_version': sklearn.__version__
+    }
+    base = save_artifacts(model, metadata)
+    print(f"Model {metadata['version']} saved to {base}.pkl/.npz/.json")
+    print(f"Live model files updated: {MODEL_FILE}, {EXPORT_FILE}")
+
+    # Validate model
+    if not args.skip_eval:
+        eval_data = args.eval_data or args.data
+        print(f"Evaluating on {eval_data}...")
+        results = evaluate(model, eval_data, args.chunk_rows)
+        print(f"Scored {results['rows']:,} rows at {results['rows_per_second']:,.0f} rows/s")
+        print(f"Predicted anomalies: {results['flagged']:,} ({results['flagged'] / results['rows'] * 100:.2f}%)")
+        if 'precision' in results:
+            print(f"Precision: {results['precision']:.3f}  Recall: {results['recall']:.3f}  F1: {results['f1']:.3f}")
+        else:
+            print(f"No '{LABEL}' column; regenerate the data to get precision/recall")
+        metadata['eval'] = dict(results, data=eval_data)
+        with open(base + ".json", "w") as f:
+            json.dump(metadata, f, indent=2)
@@ -0,0 +1,223 @@
+import math
+import struct
+import zlib
+
+# Compact binary encoding of agent log updates, shared by Agent.py and Server.py.
+# The agent offers it in 'register_agent' and switches once the server
+# accepts; JSON updates keep working, so either side can be upgraded first.
+#
+# Frame layout (little-endian):
+#   header    version u8, flags u8, string count u16, string table size u32
+#   strings   u16 length per string, then the UTF-8 bytes; zlib-compressed
+#             when FLAG_COMPRESSED is set
+#   identity  agent_id, session_id as string indexes (u16 each)
+#   metrics   cpu, memory_percent, disk_percent as f32; network_sent,
+#             network_received as f64 (MB per hour); daily_usage as f64 (MB today)
+#   counters  'buffer' then 'file_events': count u8, then (key u16, value i64)
+#   process   'process_io': count u8, then (pid u32, name u16, read and
+#             written bytes per second f32)
+#   logs      count u32, first seq u64, then one column per field:
+#             seq offset u32, timestamp u16, activity u16, details u16,
+#             anomaly_score f32, alert count u8, then all alert indexes u16
+#   features  only when FLAG_FEATURES is set (agents scored by the server):
+#             feature count u8 and threshold f32 (NaN for none) per log,
+#             then all feature values f32
+#
+# Every string (keys, activities, details, timestamps, alerts) is interned in
+# the frame's own table, so frames can be decoded in any order. Fields the
+# server can derive (cpu_trend, analysis) and the ones sent at registration
+# (system_name, version, current_user, employee_id, status) are left out.
+
+PACKED_FORMAT = 'packed-v2'
+VERSION = 2
+FLAG_COMPRESSED = 0x01
+FLAG_FEATURES = 0x02
+COMPRESS_MIN_BYTES = 256  # Smaller string tables are sent as they are
+COMPRESS_LEVEL = 1
+
+HEADER = struct.Struct('<BBHI')
+IDENTITY = struct.Struct('<HH')
+METRICS = struct.Struct('<fffddd')
+COUNTER = struct.Struct('<Hq')
+PROCESS_IO = struct.Struct('<IHff')
+LOGS_HEADER = struct.Struct('<IQ')
+
+class StringTable:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, value):
+        value = str(value)
+        i = self.index.get(value)
+        if i is None:
+            if len(self.strings) >= 0xFFFF:  # The count is a u16 too
+                raise ValueError("Too many distinct strings for one packed update")
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def pack(self):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        return struct.pack(f'<{len(encoded)}H', *map(len, encoded)) + b''.join(encoded)
+
+def unpack_strings(data, count):
+    lengths = struct.unpack_from(f'<{count}H', data)
+    strings = []
+    offset = count * 2
+    for length in lengths:
+        strings.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+    return strings
+
+def pack_counters(counters, strings):
+    counters = counters or {}
+    parts = [struct.pack('<B', len(counters))]
+    for key, value in counters.items():
+        parts.append(COUNTER.pack(strings.add(key), int(value)))
+    return b''.join(parts)
+
+def unpack_counters(body, offset, strings):
+    count = body[offset]
+    offset += 1
+    counters = {}
+    for _ in range(count):
+        key, value = COUNTER.unpack_from(body, offset)
+        counters[strings[key]] = value
+        offset += COUNTER.size
+    return counters, offset
+
+def pack_process_io(processes, strings):
+    parts = [struct.pack('<B', len(processes))]
+    for process in processes:
+        parts.append(PROCESS_IO.pack(process['pid'], strings.add(process['name']),
+                                     process['read_bytes_per_second'], process['write_bytes_per_second']))
+    return b''.join(parts)
+
+def unpack_process_io(body, offset, strings):
+    count = body[offset]
+    offset += 1
+    processes = []
+    for _ in range(count):
+        pid, name, read, write = PROCESS_IO.unpack_from(body, offset)
+        processes.append({'pid': pid, 'name': strings[name], 'read_bytes_per_second': read, 'write_bytes_per_second': write})
+        offset += PROCESS_IO.size
+    return processes, offset
+
+def encode_update(update):
+    """Pack an update dict, as built by the agent's send_update, into bytes."""
+    strings = StringTable()
+    metrics = update['performance']
+    logs = update['logs']
+    n = len(logs)
+    first_seq = logs[0]['seq'] if n else 0
+    alert_counts = [len(log['alerts']) for log in logs]
+    body = [
+        IDENTITY.pack(strings.add(update['agent_id']), strings.add(update['session_id'])),
+        METRICS.pack(metrics['cpu'], metrics['memory_percent'], metrics['disk_percent'],
+                     metrics['network_sent'], metrics['network_received'], update['network_traffic']['daily_usage']),
+        pack_counters(update.get('buffer'), strings),
+        pack_counters(update.get('file_events'), strings),
+        pack_process_io(update.get('process_io') or [], strings),
+        LOGS_HEADER.pack(n, first_seq),
+        struct.pack(f'<{n}I', *[log['seq'] - first_seq for log in logs]),
+        struct.pack(f'<{n}H', *[strings.add(log['timestamp']) for log in logs]),
+        struct.pack(f'<{n}H', *[strings.add(log['activity']) for log in logs]),
+        struct.pack(f'<{n}H', *[strings.add(log['details']) for log in logs]),
+        struct.pack(f'<{n}f', *[log['anomaly_score'] for log in logs]),
+        struct.pack(f'<{n}B', *alert_counts),
+        struct.pack(f'<{sum(alert_counts)}H', *[strings.add(alert) for log in logs for alert in log['alerts']])
+    ]
+    flags = 0
+    if any(log.get('features') is not None for log in logs):
+        # float32 is what the forest compares in, so nothing is lost
+        features = [log.get('features') or [] for log in logs]
+        thresholds = [log.get('threshold') for log in logs]
+        body += [
+            struct.pack(f'<{n}B', *map(len, features)),
+            struct.pack(f'<{n}f', *[math.nan if threshold is None else threshold for threshold in thresholds]),
+            struct.pack(f'<{sum(map(len, features))}f', *[value for row in features for value in row])
+        ]
+        flags |= FLAG_FEATURES
+    table = strings.pack()
+    if len(table) >= COMPRESS_MIN_BYTES:
+        table = zlib.compress(table, COMPRESS_LEVEL)
+        flags |= FLAG_COMPRESSED
+    return HEADER.pack(VERSION, flags, len(strings.strings), len(table)) + table + b''.join(body)
+
+def decode_update(payload):
+    """Unpack bytes from encode_update into the dict shape of a JSON update."""
+    version, flags, string_count, table_size = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported packed update version {version}")
+    offset = HEADER.size
+    table = payload[offset:offset + table_size]
+    if flags & FLAG_COMPRESSED:
+        table = zlib.decompress(table)
+    strings = unpack_strings(table, string_count)
+    body = memoryview(payload)[offset + table_size:]
+
+    agent_id, session_id = IDENTITY.unpack_from(body)
+    offset = IDENTITY.size
+    cpu, memory_percent, disk_percent, network_sent, network_received, daily_usage = METRICS.unpack_from(body, offset)
+    offset += METRICS.size
+    buffer, offset = unpack_counters(body, offset, strings)
+    file_events, offset = unpack_counters(body, offset, strings)
+    process_io, offset = unpack_process_io(body, offset, strings)
+    n, first_seq = LOGS_HEADER.unpack_from(body, offset)
+    offset += LOGS_HEADER.size
+    columns = []
+    for code, size in (('I', 4), ('H', 2), ('H', 2), ('H', 2), ('f', 4), ('B', 1)):
+        columns.append(struct.unpack_from(f'<{n}{code}', body, offset))
+        offset += n * size
+    seq_offsets, timestamps, activities, details, scores, alert_counts = columns
+    alert_indexes = struct.unpack_from(f'<{sum(alert_counts)}H', body, offset)
+    offset += sum(alert_counts) * 2
+    if flags & FLAG_FEATURES:
+        feature_counts = struct.unpack_from(f'<{n}B', body, offset)
+        offset += n
+        thresholds = struct.unpack_from(f'<{n}f', body, offset)
+        offset += n * 4
+        feature_values = struct.unpack_from(f'<{sum(feature_counts)}f', body, offset)
+
+    logs = []
+    a = 0
+    for i in range(n):
+        count = alert_counts[i]
+        logs.append({
+            'seq': first_seq + seq_offsets[i],
+            'timestamp': strings[timestamps[i]],
+            'activity': strings[activities[i]],
+            'details': strings[details[i]],
+            'anomaly_score': scores[i],
+            'alerts': [strings[j] for j in alert_indexes[a:a + count]]
+        })
+        a += count
+    if flags & FLAG_FEATURES:
+        f = 0
+        for log, count, threshold in zip(logs, feature_counts, thresholds):
+            if count:
+                log['features'] = list(feature_values[f:f + count])
+                log['threshold'] = None if math.isnan(threshold) else threshold
+                f += count
+    return {
+        'agent_id': strings[agent_id],
+        'session_id': strings[session_id],
+        'performance': {
+            'cpu': cpu,
+            'memory_percent': memory_percent,
+            'disk_percent': disk_percent,
+            'network_sent': network_sent,
+            'network_received': network_received
+        },
+        'cpu_trend': [cpu] * 5,
+        'network_traffic': {'daily_usage': daily_usage},
+        'analysis': {
+            'suspicious_patterns': [log['activity'] for log in logs if log['anomaly_score'] > 0.3],
+            'risk_score': sum(scores) * 10
+        },
+        'logs': logs,
+        'buffer': buffer,
+        'file_events': file_events,
+        'process_io': process_io
+    }